@@ -0,0 +1,59 @@
+"""Compare two benchmark result files written by benchmarks.run.
+
+Usage: python -m benchmarks.compare BASELINE CURRENT [--threshold FRACTION]
+
+Exits with status 1 if any benchmark's median got slower by more than the
+threshold (default 10%).
+"""
+import argparse
+import json
+import sys
+
+
+def compare(baseline, current, threshold):
+    rows = []
+    regressed = False
+    for name, result in sorted(current["results"].items()):
+        if name not in baseline["results"]:
+            rows.append((name, None, result["median"], None, ""))
+            continue
+        old = baseline["results"][name]["median"]
+        ratio = result["median"] / old if old else None
+        flag = ""
+        if ratio is not None and ratio > 1 + threshold:
+            flag = "REGRESSION"
+            regressed = True
+        rows.append((name, old, result["median"], ratio, flag))
+    return rows, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline["parameters"] != current["parameters"]:
+        print("Warning: benchmark parameters differ", file=sys.stderr)
+
+    rows, regressed = compare(baseline, current, args.threshold)
+    for name, old, new, ratio, flag in rows:
+        print(
+            "{:<20} {:>12} {:>12.6f} {:>8} {}".format(
+                name,
+                "-" if old is None else "{:.6f}".format(old),
+                new,
+                "-" if ratio is None else "{:.2f}x".format(ratio),
+                flag,
+            )
+        )
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
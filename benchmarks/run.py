@@ -0,0 +1,209 @@
+"""Run the QueryDuck benchmarks and write the results as JSON.
+
+Usage: python -m benchmarks.run [--size N] [--fanout N] [--repeat N] [-o FILE]
+
+Every benchmark runs against a synthetic graph served by FakeServer, so
+results are comparable between versions of the package. Use
+`python -m benchmarks.compare` to compare two result files.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from queryduck.connection import Connection
+from queryduck.query import QDQuery, Main
+from queryduck.repository import StatementRepository
+from queryduck.serialization import deserialize, serialize
+from queryduck.storage import VolumeProcessor
+from queryduck.transaction import Transaction
+from queryduck.types import Statement
+from queryduck.utility import DocProcessor, transform_doc
+
+from .server import FakeServer
+from .synthetic import SyntheticGraph, generate_file_tree
+
+
+def measure(func, repeat):
+    """Call func repeat times and return timing statistics in seconds."""
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "repeat": repeat,
+    }
+
+
+class BenchmarkSuite:
+    def __init__(self, graph, server, repeat=5, num_files=500):
+        self.graph = graph
+        self.server = server
+        self.repeat = repeat
+        self.num_files = num_files
+        self.repo = StatementRepository(Connection(server.url, "user", "password"))
+        self.bindings = self.repo.bindings_from_content(graph.bindings)
+        self.types = [self.repo.unique_deserialize(t) for t in graph.types]
+        self.random = random.Random(0)
+
+    def _type_query(self):
+        b = self.bindings
+        m = Main(Statement)
+        return QDQuery(Statement).add(
+            m.object_for(b.type) == self.random.choice(self.types),
+            m.object_for(b.label).fetch(),
+            m.object_for(b.number).order_asc("int"),
+        )
+
+    def bench_execute(self):
+        return measure(lambda: self.repo.execute(self._type_query()), self.repeat)
+
+    def bench_submit(self):
+        b = self.bindings
+
+        def submit():
+            t = Transaction()
+            for i in range(100):
+                r = t.add(None, b.type, b.Resource)
+                t.add(r, b.label, "new{}".format(i))
+            self.repo.submit(t)
+
+        return measure(submit, self.repeat)
+
+    def _full_collection(self):
+        m = Main(Statement)
+        q = QDQuery(Statement).add(m.fetch())
+        q.limit = len(self.graph.resources)
+        results, coll = self.repo.execute(q)
+        return results, coll
+
+    def bench_collection_index(self):
+        results, coll = self._full_collection()
+        return measure(coll.index, self.repeat)
+
+    def bench_collection_find(self):
+        results, coll = self._full_collection()
+        coll.index()
+        b = self.bindings
+
+        def find():
+            for r in results:
+                coll.find(s=r, p=b.label)
+                coll.find(o=r)
+
+        return measure(find, self.repeat)
+
+    def bench_serialize(self):
+        values = [deserialize(v) for row in self.graph.statements for v in row]
+        return measure(lambda: [serialize(v) for v in values], self.repeat)
+
+    def bench_deserialize(self):
+        ser_values = [v for row in self.graph.statements for v in row]
+        return measure(lambda: [deserialize(v) for v in ser_values], self.repeat)
+
+    def bench_unique_deserialize(self):
+        ser_values = [v for row in self.graph.statements for v in row]
+        return measure(
+            lambda: [self.repo.unique_deserialize(v) for v in ser_values], self.repeat
+        )
+
+    def bench_transform_doc(self):
+        doc = {}
+        for row in self.graph.statements:
+            values = [deserialize(v) for v in row]
+            doc[values[0]] = {"triple": values[1:], "meta": {"values": [values[3]] * 3}}
+        return measure(lambda: transform_doc(doc, serialize), self.repeat)
+
+    def bench_value_to_doc(self):
+        # Only the statements about the sampled resources are fetched, because
+        # walking the complete random graph grows exponentially with depth.
+        sample = [self.repo.unique_deserialize(r) for r in self.graph.resources[:20]]
+        m = Main(Statement)
+        q = QDQuery(Statement).add(m.in_list(sample), m.fetch())
+        results, coll = self.repo.execute(q)
+        processor = DocProcessor(coll, self.bindings)
+        return measure(
+            lambda: [processor.value_to_doc(r) for r in sample], self.repeat
+        )
+
+    def bench_volume_update(self):
+        timings = []
+        with tempfile.TemporaryDirectory() as root:
+            generate_file_tree(root, self.num_files)
+            for i in range(self.repeat):
+                reference = "volume{}".format(i)
+                processor = VolumeProcessor(self.repo.connection, reference, root)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    processor.update()
+                    timings.append(time.perf_counter() - start)
+        return {
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "mean": statistics.mean(timings),
+            "repeat": self.repeat,
+        }
+
+    def run(self, names=None):
+        results = {}
+        for name in sorted(dir(self)):
+            if not name.startswith("bench_"):
+                continue
+            short_name = name[len("bench_"):]
+            if names and short_name not in names:
+                continue
+            results[short_name] = getattr(self, name)()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output")
+    parser.add_argument("benchmarks", nargs="*")
+    args = parser.parse_args()
+
+    graph = SyntheticGraph(size=args.size, fanout=args.fanout, seed=args.seed)
+    with FakeServer(graph.statements) as server:
+        server.page_size = len(graph.statements)
+        suite = BenchmarkSuite(graph, server, args.repeat, args.files)
+        results = suite.run(args.benchmarks)
+
+    report = {
+        "created": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "parameters": {
+            "size": args.size,
+            "fanout": args.fanout,
+            "files": args.files,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "statements": len(graph.statements),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""In-process stand-in for the QueryDuck server.
+
+Implements the statement, query, batch and volume file endpoints on top of
+a local Collection, evaluating queries with QueryEvaluator. It is meant for
+benchmarks and experiments that need a server without a database.
+"""
+import base64
+import gzip
+import json
+import threading
+import uuid
+import zlib
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from queryduck.collection import Collection
+from queryduck.evaluator import QueryEvaluator
+from queryduck.query import request_params_to_query
+from queryduck.repository import StatementRepository
+from queryduck.serialization import serialize
+from queryduck.types import Statement
+
+
+class FakeServer:
+    def __init__(self, ser_statements=None, batch=True, page_size=1000):
+        self.repo = StatementRepository(None)
+        self.statements = []
+        self.coll = Collection()
+        self.batch = batch
+        self.page_size = page_size
+        self.requests = 0
+        self.volumes = {}
+        self.lock = threading.Lock()
+        if ser_statements:
+            self.create_statements(ser_statements)
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        server = self
+
+        class Handler(RequestHandler):
+            fake = server
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type_, value, traceback):
+        self.stop()
+
+    def create_statements(self, ser_statements):
+        statements = {}
+        for row in ser_statements:
+            handle, *ser_triple = row
+            st = self.repo.unique_deserialize(handle)
+            st.triple = tuple(self.repo.unique_deserialize(v) for v in ser_triple)
+            statements[st.handle] = st
+            self.statements.append(row)
+        with self.lock:
+            self.coll.add_statements(statements)
+        return {}
+
+    def submit_transaction(self, ser_statements):
+        created = [Statement(handle=uuid.uuid4()) for row in ser_statements]
+        statements = {}
+        for st, row in zip(created, ser_statements):
+            self.repo.statement_map[st.handle] = st
+            st.triple = tuple(
+                created[v] if type(v) == int else self.repo.unique_deserialize(v)
+                for v in row[1:]
+            )
+            statements[st.handle] = st
+            self.statements.append([serialize(v) for v in (st,) + st.triple])
+        with self.lock:
+            self.coll.add_statements(statements)
+        return {
+            "references": [serialize(st) for st in created],
+            "statements": self._serialize_statements(statements.values()),
+        }
+
+    def get_statements(self, after=None):
+        start = 0
+        if after is not None:
+            handles = [row[0] for row in self.statements]
+            start = handles.index(after) + 1
+        return {"statements": self.statements[start : start + self.page_size]}
+
+    def query(self, params, target):
+        query = request_params_to_query(params, target, self.repo.unique_deserialize)
+        for k, v in params:
+            if k == "limit":
+                query.limit = int(v)
+        with self.lock:
+            results, coll = QueryEvaluator(self.coll).execute(query)
+        response = {
+            "references": [serialize(r) for r in results],
+            "statements": self._serialize_statements(coll.statements.values()),
+        }
+        if coll.files:
+            response["files"] = {
+                serialize(b): [serialize(f) for f in files]
+                for b, files in coll.files.items()
+            }
+        return response
+
+    def mutate_files(self, reference, files):
+        volume = self.volumes.setdefault(reference, {})
+        with self.lock:
+            for path, info in files.items():
+                if info is None:
+                    volume.pop(path, None)
+                else:
+                    volume[path] = dict(info, path=path)
+        return {}
+
+    def get_files(self, reference, params):
+        volume = self.volumes.get(reference, {})
+        paths = [
+            base64.urlsafe_b64decode(v).decode("utf-8") for k, v in params if k == "path"
+        ]
+        if paths:
+            return {"results": [volume[p] for p in paths if p in volume]}
+        params = dict(params)
+        limit = int(params.get("limit", 1000))
+        rows = sorted(volume.values(), key=lambda r: r["path"].encode("utf-8"))
+        if "after" in params:
+            after = base64.urlsafe_b64decode(params["after"]).decode("utf-8")
+            rows = [r for r in rows if r["path"].encode() > after.encode()]
+        return {"results": rows[:limit], "limit": limit}
+
+    def _serialize_statements(self, statements):
+        return {
+            serialize(st): [serialize(v) for v in st.triple] for st in statements
+        }
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+    fake = None
+    compress_threshold = 1024
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        accept = self.headers.get("Accept-Encoding", "")
+        if len(data) >= self.compress_threshold and "gzip" in accept:
+            data = gzip.compress(data)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_chunked(self):
+        parts = []
+        while True:
+            size = int(self.rfile.readline().split(b";")[0], 16)
+            if size == 0:
+                self.rfile.readline()
+                break
+            parts.append(self.rfile.read(size))
+            self.rfile.readline()
+        return b"".join(parts)
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            data = self._read_chunked()
+        else:
+            data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        encoding = self.headers.get("Content-Encoding")
+        if encoding == "gzip":
+            data = zlib.decompress(data, 31)
+        elif encoding == "zstd":
+            import zstandard
+
+            data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        return json.loads(data) if data else None
+
+    def do_GET(self):
+        self.fake.requests += 1
+        url = urlsplit(self.path)
+        params = parse_qsl(url.query, keep_blank_values=True)
+        parts = url.path.strip("/").split("/")
+        if parts == ["statements"]:
+            self._respond(200, self.fake.get_statements(dict(params).get("after")))
+        elif len(parts) == 2 and parts[1] == "query":
+            self._respond(200, self.fake.query(params, parts[0]))
+        elif len(parts) == 3 and parts[0] == "volumes" and parts[2] == "files":
+            self._respond(200, self.fake.get_files(parts[1], params))
+        else:
+            self._respond(404, {})
+
+    def do_POST(self):
+        self.fake.requests += 1
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        body = self._read_body()
+        if parts == ["statements"]:
+            self._respond(200, self.fake.create_statements(body))
+        elif parts == ["statements", "transaction"]:
+            self._respond(200, self.fake.submit_transaction(body))
+        elif len(parts) == 2 and parts[1] == "query":
+            self._respond(200, self.fake.query(body, parts[0]))
+        elif len(parts) == 3 and parts[1:] == ["query", "batch"] and self.fake.batch:
+            results = [self.fake.query(p, parts[0]) for p in body["queries"]]
+            self._respond(200, {"results": results})
+        elif len(parts) == 3 and parts[0] == "volumes" and parts[2] == "files":
+            self._respond(200, self.fake.mutate_files(parts[1], body))
+        else:
+            self._respond(404, {})
@@ -0,0 +1,77 @@
+"""Measure import time and bindings load time of the queryduck package.
+
+Usage: python -m benchmarks.startup [--runs N]
+
+Each measurement runs in a fresh interpreter, so the results reflect what a
+short-lived CLI invocation experiences.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_SNIPPET = """
+import time
+t = time.perf_counter()
+import queryduck.main
+print(time.perf_counter() - t)
+"""
+
+BINDINGS_SNIPPET = """
+import time
+from queryduck.main import QueryDuck
+qd = QueryDuck("http://localhost", "user", "password")
+t = time.perf_counter()
+qd.get_bindings()
+print(time.perf_counter() - t)
+"""
+
+
+def run_snippet(snippet, *args):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+        + ([env["PYTHONPATH"]] if "PYTHONPATH" in env else [])
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", snippet] + list(args),
+        check=True,
+        stdout=subprocess.PIPE,
+        env=env,
+    )
+    return float(out.stdout.decode().strip().splitlines()[-1])
+
+
+def imported_modules():
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import queryduck.main"],
+        check=True,
+        stderr=subprocess.PIPE,
+    )
+    lines = out.stderr.decode().splitlines()[1:]
+    return [line.split("|")[-1].strip() for line in lines]
+
+
+def measure(runs):
+    bindings = [run_snippet(BINDINGS_SNIPPET) for i in range(runs)]
+    imports = [run_snippet(IMPORT_SNIPPET) for i in range(runs)]
+    modules = imported_modules()
+    return {
+        "import_seconds": statistics.median(imports),
+        "bindings_seconds": statistics.median(bindings),
+        "imports_requests": "requests" in modules,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    json.dump(measure(args.runs), sys.stdout, indent=4)
+    print()
+
+
+if __name__ == "__main__":
+    main()
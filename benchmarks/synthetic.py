@@ -0,0 +1,77 @@
+"""Generators for synthetic statement graphs and file trees."""
+import datetime
+import os
+import random
+import uuid
+
+from decimal import Decimal
+
+
+class SyntheticGraph:
+    """A reproducible random graph of resources, in serialized statement form.
+
+    The graph contains `size` resources of `num_types` types. Each resource
+    has a type, a label, an integer, a decimal and a datetime attribute, and
+    `fanout` links to other resources through `num_predicates` predicates.
+    Types and predicates are part of the bindings, like they would be in a
+    schema.
+    """
+
+    def __init__(self, size=1000, fanout=4, num_predicates=8, num_types=5, seed=0):
+        self.random = random.Random(seed)
+        self.size = size
+        self.fanout = fanout
+        self.bindings = {
+            name: self._handle()
+            for name in ("Resource", "type", "label", "number", "amount", "created")
+        }
+        self.types = [self._handle() for i in range(num_types)]
+        self.predicates = [self._handle() for i in range(num_predicates)]
+        self.bindings.update({"Type{}".format(i): t for i, t in enumerate(self.types)})
+        self.bindings.update(
+            {"link{}".format(i): p for i, p in enumerate(self.predicates)}
+        )
+        self.resources = [self._handle() for i in range(size)]
+        self.statements = []
+        self._generate()
+
+    def _handle(self):
+        return "s:{}".format(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def _add(self, s, p, o):
+        self.statements.append([self._handle(), s, p, o])
+
+    def _generate(self):
+        b = self.bindings
+        epoch = datetime.datetime(2020, 1, 1)
+        for t in self.types:
+            self._add(t, b["type"], b["Resource"])
+        for idx, r in enumerate(self.resources):
+            self._add(r, b["type"], self.random.choice(self.types))
+            self._add(r, b["label"], "str:resource{}".format(idx))
+            self._add(r, b["number"], "int:{}".format(self.random.randrange(1000)))
+            amount = Decimal(self.random.randrange(100000)) / 100
+            self._add(r, b["amount"], "dec:{}".format(amount))
+            created = epoch + datetime.timedelta(seconds=self.random.randrange(10 ** 8))
+            self._add(r, b["created"], "datetime:{}".format(created.isoformat()))
+            for i in range(self.fanout):
+                self._add(
+                    r,
+                    self.random.choice(self.predicates),
+                    self.random.choice(self.resources),
+                )
+
+
+def generate_file_tree(root, num_files=1000, dir_fanout=10, file_size=4096, seed=0):
+    """Create a directory tree of random files under root."""
+    rnd = random.Random(seed)
+    for i in range(num_files):
+        parts = []
+        n = i
+        while n >= dir_fanout:
+            n //= dir_fanout
+            parts.append("d{}".format(n % dir_fanout))
+        directory = os.path.join(root, *parts)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "file{}.bin".format(i)), "wb") as f:
+            f.write(rnd.getrandbits(file_size * 8).to_bytes(file_size, "little"))
@@ -0,0 +1,173 @@
+"""Transfer of blob content between stores.
+
+A store holds blob content keyed by Blob handle, which is the SHA-256 digest
+of the content. Stores that content can be read from implement
+`missing(blobs)` and `read(blob, offset)`; stores that content can be
+written to implement `missing(blobs)` and `writer(blob)` as well.
+"""
+import hashlib
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .exceptions import NotFoundError, QDValueError
+from .instrumentation import get_instrumentation
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def read_chunks(path, offset=0, chunk_size=CHUNK_SIZE):
+    """Yield the content of a file from offset on, in chunks.
+
+    The chunks are views on a single buffer that is reused for every chunk,
+    so they have to be consumed before the next one is requested.
+    """
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        f.seek(offset)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            yield view[:n]
+
+
+class BlobWriter:
+    """Write blob content to a partial file, and move it into place once verified.
+
+    If the partial file already exists, writing resumes at its end: `offset`
+    is its size, and its content is hashed again first so the complete blob
+    can still be verified.
+    """
+
+    def __init__(self, blob, partial_path, path):
+        self.blob = blob
+        self.partial_path = partial_path
+        self.path = path
+        self.hash = hashlib.sha256()
+        self.offset = 0
+        if partial_path.exists():
+            for chunk in read_chunks(partial_path):
+                self.hash.update(chunk)
+                self.offset += len(chunk)
+        self.f = open(partial_path, "ab")
+
+    def write(self, chunk):
+        self.hash.update(chunk)
+        self.f.write(chunk)
+        self.offset += len(chunk)
+
+    def commit(self):
+        """Verify the content and publish the blob."""
+        self.f.close()
+        if self.hash.digest() != self.blob.handle:
+            os.remove(self.partial_path)
+            raise QDValueError(
+                "Content of {} doesn't match its handle".format(self.blob)
+            )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.partial_path, self.path)
+
+    def abort(self):
+        """Stop writing, and keep the partial file to resume from later."""
+        self.f.close()
+
+
+class LocalBlobStore:
+    """Content-addressed blob store in a local directory.
+
+    Blobs are stored under the hex digest of their handle. Incomplete
+    transfers are kept in a separate directory, and resume where they left
+    off.
+    """
+
+    def __init__(self, root, chunk_size=CHUNK_SIZE):
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+        self.partial_root = self.root / "partial"
+        self.partial_root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, blob):
+        name = blob.handle.hex()
+        return self.root / name[:2] / name[2:]
+
+    def missing(self, blobs):
+        return [b for b in blobs if not self.path(b).exists()]
+
+    def read(self, blob, offset=0):
+        path = self.path(blob)
+        if not path.exists():
+            raise NotFoundError("{} is not stored".format(blob))
+        return read_chunks(path, offset, self.chunk_size)
+
+    def writer(self, blob):
+        return BlobWriter(blob, self.partial_root / blob.handle.hex(), self.path(blob))
+
+
+class VolumeBlobSource:
+    """Read blob content from the files in volumes that hold it.
+
+    `coll` provides the files of every blob through `get_files`, and a
+    StorageHelper resolves them to local paths. Blobs without a readable
+    file count as missing.
+    """
+
+    def __init__(self, storage_helper, coll, chunk_size=CHUNK_SIZE):
+        self.storage_helper = storage_helper
+        self.coll = coll
+        self.chunk_size = chunk_size
+
+    def path(self, blob):
+        for file_ in self.coll.get_files(blob):
+            path = self.storage_helper.path_from_file(file_)
+            if path is not None and path.is_file():
+                return path
+        return None
+
+    def missing(self, blobs):
+        return [b for b in blobs if self.path(b) is None]
+
+    def read(self, blob, offset=0):
+        path = self.path(blob)
+        if path is None:
+            raise NotFoundError("No readable file for {}".format(blob))
+        return read_chunks(path, offset, self.chunk_size)
+
+
+class BlobTransfer:
+    """Copy blob content from a source store to a target store.
+
+    Blobs that the target already has are skipped, and up to `parallelism`
+    blobs are streamed at the same time. Content is hashed while it is
+    written, and only published in the target if it matches the handle.
+    Interrupted transfers resume from the partial content in the target.
+    """
+
+    def __init__(self, source, target, parallelism=4):
+        self.source = source
+        self.target = target
+        self.parallelism = parallelism
+
+    def _transfer(self, blob):
+        writer = self.target.writer(blob)
+        start = writer.offset
+        try:
+            for chunk in self.source.read(blob, start):
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.commit()
+        get_instrumentation().count(
+            "queryduck_blob_transferred_bytes_total", writer.offset - start
+        )
+
+    def transfer(self, blobs):
+        """Transfer the blobs the target is missing, return their number."""
+        unique = {b.handle: b for b in blobs}
+        missing = self.target.missing(list(unique.values()))
+        with ThreadPoolExecutor(self.parallelism) as executor:
+            list(executor.map(self._transfer, missing))
+        return len(missing)
@@ -1,4 +1,6 @@
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+
+from .instrumentation import get_instrumentation
 
 def statement_generator(statements, s, p, o):
     for st in statements:
@@ -20,7 +22,7 @@ class BaseCollection:
 
     def first(self, s=None, p=None, o=None):
         statements = self.find(s, p, o)
-        return next(statements, None)
+        return next(iter(statements), None)
 
     def objects_for(self, subject, predicate):
         return [s.triple[2] for s in self.find(s=subject, p=predicate)]
@@ -53,7 +55,7 @@ class Collection(BaseCollection):
         else:
             for k, v in statements.items():
                 self.statements[k] = v
-        self.index()
+        self.indexed = None
 
     def add_files(self, files):
         if len(self.files) == 0:
@@ -63,7 +65,13 @@ class Collection(BaseCollection):
                 self.files[k] = v
 
     def index(self):
-        self.indexed = defaultdict(list)
+        with get_instrumentation().timer("queryduck_index_seconds"):
+            self._build_index()
+
+    def _build_index(self):
+        # The index is only published once complete, so concurrent readers of a
+        # shared Collection never see a partial index.
+        indexed = defaultdict(list)
         for st in self.statements.values():
             for triple in [
                 (st.triple[0], st.triple[1], st.triple[2]),
@@ -74,21 +82,34 @@ class Collection(BaseCollection):
                 (None, st.triple[1], None),
                 (st.triple[0], None, None),
             ]:
-                self.indexed[triple].append(st)
+                indexed[triple].append(st)
+        self.indexed = indexed
 
     def get(self, uuid_):
         return self.statements[uuid_]
 
     def find(self, s=None, p=None, o=None):
-        if self.indexed:
-            return self.indexed[(s, p, o)]
-        else:
-            st_gen = statement_generator(self.statements.values(), s, p, o)
-            return st_gen
+        if s is None and p is None and o is None:
+            return list(self.statements.values())
+        if self.indexed is None:
+            self.index()
+        return self.indexed.get((s, p, o), [])
 
     def get_files(self, blob):
         return self.files.get(blob, [])
 
+    def freeze(self, path):
+        """Write the collection to path, to be attached as a FrozenCollection."""
+        from .frozen import freeze_collection
+
+        freeze_collection(self, path)
+
+    def to_arrow(self):
+        """Return the statements as a pyarrow Table, see ColumnarExport."""
+        from .columnar import collection_to_arrow
+
+        return collection_to_arrow(self)
+
 
 class GroupedCollection(BaseCollection):
     def __init__(self, collections=None):
@@ -105,3 +126,95 @@ class GroupedCollection(BaseCollection):
         for c in self.collections:
             files += c.get_files(blob)
         return files
+
+
+class BoundedGroupedCollection(GroupedCollection):
+    """GroupedCollection that evicts its least recently used member collections.
+
+    The size of each member is estimated from its number of statements and
+    files, and statements shared by several members are only counted once.
+    Files count towards `max_statements` like statements do. When the total
+    exceeds `max_statements` or `max_bytes`, members are evicted in least
+    recently used order, skipping those for which `pinned` returns true.
+    A member counts as used when it is added or yields a result from `find`.
+    """
+
+    # Approximate memory use of an indexed statement, including its triple
+    # values and index entries.
+    statement_size = 1200
+    file_size = 400
+
+    def __init__(
+        self, collections=None, max_statements=None, max_bytes=None, pinned=None
+    ):
+        super().__init__([])
+        self.max_statements = max_statements
+        self.max_bytes = max_bytes
+        self.pinned = pinned
+        self.usage = OrderedDict()
+        # Number of files of each member, by id of the collection
+        self.file_counts = {}
+        self.num_files = 0
+        # Number of members holding each statement, by id of the statement
+        self.refs = {}
+        if collections is not None:
+            for c in collections:
+                self.add_collection(c)
+
+    @property
+    def num_statements(self):
+        return len(self.refs)
+
+    @property
+    def num_bytes(self):
+        return (
+            self.num_statements * self.statement_size
+            + self.num_files * self.file_size
+        )
+
+    def add_collection(self, collection):
+        if id(collection) in self.usage:
+            self.usage.move_to_end(id(collection))
+            return
+        super().add_collection(collection)
+        statements = getattr(collection, "statements", {})
+        for st in statements.values():
+            self.refs[id(st)] = self.refs.get(id(st), 0) + 1
+        num_files = sum(len(v) for v in getattr(collection, "files", {}).values())
+        self.file_counts[id(collection)] = num_files
+        self.num_files += num_files
+        self.usage[id(collection)] = collection
+        self.evict()
+
+    def remove_collection(self, collection):
+        self.collections = [c for c in self.collections if c is not collection]
+        for st in getattr(collection, "statements", {}).values():
+            count = self.refs.pop(id(st), 0)
+            if count > 1:
+                self.refs[id(st)] = count - 1
+        self.num_files -= self.file_counts.pop(id(collection))
+        del self.usage[id(collection)]
+
+    def _over_budget(self):
+        return (
+            self.max_statements is not None
+            and self.num_statements + self.num_files > self.max_statements
+        ) or (self.max_bytes is not None and self.num_bytes > self.max_bytes)
+
+    def evict(self):
+        """Remove least recently used members until the budget is met."""
+        for collection in list(self.usage.values()):
+            if not self._over_budget():
+                break
+            if self.pinned is not None and self.pinned(collection):
+                continue
+            self.remove_collection(collection)
+
+    def find(self, s=None, p=None, o=None):
+        for coll in list(self.collections):
+            used = False
+            for st in coll.find(s, p, o):
+                if not used and id(coll) in self.usage:
+                    self.usage.move_to_end(id(coll))
+                    used = True
+                yield st
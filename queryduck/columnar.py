@@ -0,0 +1,233 @@
+"""Export of statements to columnar arrays, for analytics.
+
+Every statement becomes a row with its handle, subject and predicate, the
+vtype of its object, and the object value in the column for that vtype
+(`object_int`, `object_str`, ...). The other value columns of the row are
+null. Arrow tables are built with pyarrow, and NumPy arrays are taken from
+them without copying wherever Arrow's memory layout allows it. pyarrow and
+numpy are optional, and only imported when they are needed.
+"""
+import base64
+import datetime
+
+from decimal import Decimal
+
+from .query import query_to_request_params
+from .serialization import serialize
+from .streaming import JSONStreamParser
+from .types import Blob, value_types_by_native
+
+VALUE_VTYPES = ("s", "int", "bool", "dec", "datetime", "str", "bytes", "blob", "file")
+ID_COLUMNS = ("handle", "subject", "predicate", "object_s")
+
+parsers = {
+    "s": str,
+    "int": int,
+    "bool": lambda v: v == "True",
+    "dec": Decimal,
+    "datetime": datetime.datetime.fromisoformat,
+    "str": str,
+    "bytes": base64.urlsafe_b64decode,
+    "blob": str,
+    "file": str,
+}
+
+
+def _native_column_value(vtype, value):
+    if vtype == "s":
+        return str(value.handle)
+    elif vtype in ("blob", "file"):
+        return value.serialize()
+    return value
+
+
+class ColumnarExport:
+    """Collect statements into columns, and convert them to Arrow or NumPy.
+
+    Statements can be added as objects, or in serialized form straight from
+    a query response, in which case they are never deserialized into
+    Statements at all.
+
+    Rows are only appended to plain lists, with each object value in the
+    list of its vtype. The Arrow columns are built from these lists a whole
+    column at a time when the export is converted.
+    """
+
+    def __init__(self):
+        self.handles = []
+        self.subjects = []
+        self.predicates = []
+        self.vtypes = []
+        self.values = {vtype: [] for vtype in VALUE_VTYPES}
+
+    def __len__(self):
+        return len(self.handles)
+
+    def _add_row(self, handle, subject, predicate, vtype, value):
+        self.handles.append(handle)
+        self.subjects.append(subject)
+        self.predicates.append(predicate)
+        self.vtypes.append(vtype)
+        values = self.values.get(vtype)
+        if values is not None:
+            values.append(value)
+
+    def add_statement(self, statement):
+        s, p, o = statement.triple
+        vtype = value_types_by_native[type(o)]
+        value = None if o is None else _native_column_value(vtype, o)
+        self._add_row(
+            str(statement.handle), str(s.handle), str(p.handle), vtype, value
+        )
+
+    def add_serialized(self, ser_handle, ser_triple):
+        """Add a statement in the serialized form of query responses."""
+        vtype, ser_value = ser_triple[2].split(":", 1)
+        value = parsers[vtype](ser_value) if vtype in parsers else None
+        self._add_row(
+            ser_handle[2:], ser_triple[0][2:], ser_triple[1][2:], vtype, value
+        )
+
+    def add_collection(self, coll):
+        for statement in coll.statements.values():
+            self.add_statement(statement)
+
+    def add_query(self, repo, query, serializer=serialize):
+        """Add the statements a query fetches, streaming them from the server."""
+        target = "blob" if query.target == Blob else "statement"
+        params = query_to_request_params(query, serializer)
+        chunks = repo.connection.post_query(params, target, stream=True)
+        for section, item in JSONStreamParser(chunks).sections(("statements",)):
+            if section == "statements":
+                self.add_serialized(*item)
+
+    def columns(self):
+        """Return the columns as a dict of lists."""
+        columns = {
+            "handle": self.handles,
+            "subject": self.subjects,
+            "predicate": self.predicates,
+            "vtype": self.vtypes,
+        }
+        for vtype, values in self.values.items():
+            it = iter(values)
+            columns["object_{}".format(vtype)] = [
+                next(it) if v == vtype else None for v in self.vtypes
+            ]
+        return columns
+
+    def to_arrow(self):
+        """Return the columns as a pyarrow Table.
+
+        The ID columns (handle, subject, predicate and object_s) are
+        dictionary arrays with int32 indices into one dictionary of 16 byte
+        statement UUIDs.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        types = {
+            "int": pa.int64(),
+            "bool": pa.bool_(),
+            "str": pa.string(),
+            "bytes": pa.binary(),
+            "blob": pa.string(),
+            "file": pa.string(),
+        }
+        id_lists = [self.handles, self.subjects, self.predicates, self.values["s"]]
+        encoded = pa.concat_arrays(
+            [pa.array(ids, pa.string()) for ids in id_lists]
+        ).dictionary_encode()
+        uuids = bytes.fromhex("".join(encoded.dictionary.to_pylist()).replace("-", ""))
+        dictionary = pa.Array.from_buffers(
+            pa.binary(16), len(encoded.dictionary), [None, pa.py_buffer(uuids)]
+        )
+        indices = encoded.indices.cast(pa.int32())
+        id_columns = []
+        offset = 0
+        for ids in id_lists:
+            id_columns.append(indices.slice(offset, len(ids)))
+            offset += len(ids)
+
+        vtypes = pa.array(self.vtypes, pa.string())
+        arrays = {
+            "handle": id_columns[0],
+            "subject": id_columns[1],
+            "predicate": id_columns[2],
+            "vtype": vtypes.dictionary_encode(),
+        }
+        missing = pa.scalar(None, pa.int32())
+        for vtype, values in self.values.items():
+            if vtype == "s":
+                values = id_columns[3]
+            else:
+                # Decimals and datetimes get their precision and time zone
+                # inferred.
+                values = pa.array(values, types.get(vtype))
+            # Row i of the column is value k of the vtype if it is the k-th row
+            # of that vtype.
+            selected = pc.equal(vtypes, vtype)
+            positions = pc.cumulative_sum(selected.cast(pa.int32()))
+            positions = pc.subtract(positions, 1)
+            arrays["object_{}".format(vtype)] = values.take(
+                pc.if_else(selected, positions, missing)
+            )
+        for name in ID_COLUMNS:
+            arrays[name] = pa.DictionaryArray.from_arrays(arrays[name], dictionary)
+        return pa.table(arrays)
+
+    def to_numpy(self):
+        """Return the columns as a dict of NumPy arrays.
+
+        The ID columns hold int32 indices into the `ids` array, which has the
+        UUIDs of the statements as 16 byte void values. Columns with nulls are
+        returned as masked arrays that keep the type of the column, with zeros
+        in place of the nulls of integer, boolean and temporal columns.
+        Columns without nulls of fixed-width types share memory with the
+        Arrow table they are taken from.
+        """
+        import numpy as np
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        table = self.to_arrow()
+        arrays = {}
+        for name in table.column_names:
+            column = table.column(name)
+            if name in ID_COLUMNS:
+                column = pa.chunked_array(
+                    [c.indices for c in column.chunks], pa.int32()
+                )
+            if column.null_count == 0:
+                arrays[name] = column.to_numpy()
+                continue
+            mask = pc.is_null(column).to_numpy()
+            if pa.types.is_boolean(column.type):
+                column = pc.fill_null(column, False)
+            elif pa.types.is_integer(column.type) or pa.types.is_temporal(column.type):
+                column = pc.fill_null(column, pa.scalar(0).cast(column.type))
+            arrays[name] = np.ma.masked_array(column.to_numpy(), mask)
+        ids = table.column("handle").chunk(0).dictionary
+        arrays["ids"] = np.frombuffer(ids.buffers()[1], "V16", len(ids))
+        return arrays
+
+    def write_ipc(self, path):
+        """Write the columns to an Arrow IPC file."""
+        import pyarrow as pa
+
+        table = self.to_arrow()
+        with pa.OSFile(str(path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    def write_parquet(self, path):
+        """Write the columns to a Parquet file."""
+        import pyarrow.parquet as pq
+
+        pq.write_table(self.to_arrow(), str(path))
+
+
+def collection_to_arrow(coll):
+    export = ColumnarExport()
+    export.add_collection(coll)
+    return export.to_arrow()
@@ -0,0 +1,75 @@
+import threading
+
+from contextlib import nullcontext
+
+from .deadlines import remaining
+from .exceptions import DeadlineExceeded
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Let concurrent calls with the same key share the outcome of one call.
+
+    The first caller for a key performs the call; callers arriving while it is
+    in flight wait for it and receive the same result (or exception). Once the
+    call has finished, the next caller for that key starts a new one. Waiting
+    callers stop waiting with DeadlineExceeded when their own deadline passes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            if not call.event.wait(remaining()):
+                raise DeadlineExceeded()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+        return call.result
+
+
+class ShardedLock:
+    """A fixed set of locks, one of which is picked by hashing a key.
+
+    Operations on different keys mostly use different locks, so they don't
+    contend with each other.
+    """
+
+    def __init__(self, shards=64):
+        self.locks = [threading.Lock() for i in range(shards)]
+
+    def __call__(self, key):
+        return self.locks[hash(key) % len(self.locks)]
+
+
+class NullLock:
+    """Stand-in for ShardedLock when no locking is needed."""
+
+    lock = nullcontext()
+
+    def __call__(self, key):
+        return self.lock
@@ -1,24 +1,97 @@
+import codecs
 import json
+import os
+import random
+import threading
+import time
+import weakref
+import zlib
 
 from base64 import urlsafe_b64encode
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+from itertools import chain
 
-import requests
+from .deadlines import bind_deadline, remaining
+from .exceptions import DeadlineExceeded, NotFoundError
+from .instrumentation import get_instrumentation
 
-from requests.exceptions import HTTPError
 
-from .exceptions import NotFoundError
+@lru_cache(maxsize=None)
+def zstd_available():
+    try:
+        import zstandard
+    except ImportError:
+        return False
+    return True
 
 
 class APIWrapper(object):
-    """Simple generic wrapper class for RESTful API's."""
+    """Simple generic wrapper class for RESTful API's.
 
-    def __init__(self, url, username, password):
+    The Requests library is only imported when the first request is made, so
+    importing this module doesn't slow down short-lived processes that never
+    contact the server.
+
+    Request bodies larger than `compress_threshold` bytes are compressed while
+    they are being serialized, using `compression` ("gzip", "zstd" or None,
+    the default). Enable it only for servers that accept compressed bodies.
+    If the server rejects a compressed body with 415, or with a 400 that
+    mentions the encoding, compression is disabled for the rest of the session
+    and the request is sent again uncompressed. Compressed responses are
+    always accepted.
+
+    Requests time out after `timeout` seconds, or earlier if a deadline set
+    with `queryduck.deadlines.deadline` is closer. Like in Requests, the
+    timeout applies to connecting and to every read from the socket, not to
+    the complete response: a body that keeps trickling in can take longer.
+    A deadline is checked again once the body has been received, and raises
+    DeadlineExceeded if it has passed by then.
+
+    If `hedge_quantile` is set (e.g. 0.95), idempotent reads that take longer
+    than that quantile of the last `latency_window` latencies of their path
+    are sent a second time, and the first response wins. The other request
+    finishes in the background. Both are sent from a pool of `hedge_workers`
+    threads, which `close` shuts down. Hedging starts once a path has
+    `hedge_min_samples` latency samples.
+    """
+
+    chunk_size = 64 * 1024
+    hedge_workers = 8
+    latency_window = 200
+
+    def __init__(
+        self,
+        url,
+        username,
+        password,
+        compression=None,
+        compress_threshold=65536,
+        timeout=None,
+        hedge_quantile=None,
+        hedge_min_samples=20,
+    ):
         """Make the provided API URL available."""
         self.url = url
         self.auth = (username, password)
+        if compression == "zstd" and not zstd_available():
+            compression = "gzip"
+        self.compression = compression
+        self.compress_threshold = compress_threshold
+        accept = ["gzip", "deflate"] + (["zstd"] if zstd_available() else [])
+        self.headers = {"Accept-Encoding": ", ".join(accept)}
+        self.timeout = timeout
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = {}
+        self._latency_lock = threading.Lock()
+        self._hedge_executor = None
 
     def _raise_from_request(self, r):
         """Call the raise_for_status Requests method and handle result."""
+        from requests.exceptions import HTTPError
+
         try:
             r.raise_for_status()
         except HTTPError as e:
@@ -27,38 +100,249 @@ class APIWrapper(object):
             else:
                 raise e
 
-    def get(self, path, params=None):
-        """Perform a GET request to a path."""
-        r = requests.get("{}/{}".format(self.url, path), params=params, auth=self.auth)
+    def _compressor(self):
+        if self.compression == "zstd":
+            import zstandard
+
+            return zstandard.ZstdCompressor().compressobj()
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def _compress_stream(self, chunks):
+        """Compress a stream of JSON text chunks into larger compressed chunks."""
+        compressor = self._compressor()
+        buf = []
+        size = 0
+        for chunk in chunks:
+            buf.append(chunk)
+            size += len(chunk)
+            if size >= self.chunk_size:
+                out = compressor.compress("".join(buf).encode("utf-8"))
+                buf, size = [], 0
+                if out:
+                    yield out
+        yield compressor.compress("".join(buf).encode("utf-8")) + compressor.flush()
+
+    def _encode_body(self, data):
+        """Serialize a request body, and compress it if it turns out to be large.
+
+        Returns the body and the headers to send with it. A compressed body is
+        a generator, so the complete serialized JSON is never held in memory.
+        Without compression the much faster `json.dumps` is used instead.
+        """
+        if not self.compression:
+            return json.dumps(data).encode("utf-8"), {}
+        chunks = json.JSONEncoder().iterencode(data)
+        head = []
+        size = 0
+        for chunk in chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size >= self.compress_threshold:
+                body = self._compress_stream(chain(head, chunks))
+                return body, {"Content-Encoding": self.compression}
+        return "".join(head).encode("utf-8"), {}
+
+    def _encoding_rejected(self, r):
+        if r.status_code == 415:
+            return True
+        return r.status_code == 400 and "encoding" in r.text.lower()
+
+    def _count_sent(self, chunks, instr, method):
+        for chunk in chunks:
+            instr.count("queryduck_http_sent_bytes_total", len(chunk), method=method)
+            yield chunk
+
+    def _iter_text(self, r, instr, method):
+        """Yield the body of a streamed response as text chunks."""
+        decoder = codecs.getincrementaldecoder(r.encoding or "utf-8")()
+        try:
+            for chunk in r.iter_content(self.chunk_size):
+                if instr.enabled:
+                    instr.count(
+                        "queryduck_http_received_bytes_total", len(chunk), method=method
+                    )
+                yield decoder.decode(chunk)
+            yield decoder.decode(b"", final=True)
+        finally:
+            r.close()
+
+    def _timeout(self):
+        left = remaining()
+        if left is None or (self.timeout is not None and self.timeout < left):
+            return self.timeout
+        return left
+
+    def _observe_latency(self, path, elapsed):
+        with self._latency_lock:
+            if path not in self.latencies:
+                self.latencies[path] = deque(maxlen=self.latency_window)
+            self.latencies[path].append(elapsed)
+
+    def _hedge_delay(self, path):
+        """Return how long to wait before hedging a request, or None."""
+        with self._latency_lock:
+            window = self.latencies.get(path)
+            if window is None or len(window) < self.hedge_min_samples:
+                return None
+            ordered = sorted(window)
+        return ordered[min(int(self.hedge_quantile * len(ordered)), len(ordered) - 1)]
+
+    def _hedge_pool(self):
+        with self._latency_lock:
+            if self._hedge_executor is None:
+                executor = ThreadPoolExecutor(max_workers=self.hedge_workers)
+                weakref.finalize(self, executor.shutdown, wait=False)
+                self._hedge_executor = executor
+            return self._hedge_executor
+
+    def close(self):
+        """Shut down the threads that send hedged requests."""
+        with self._latency_lock:
+            executor, self._hedge_executor = self._hedge_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _hedged_request(self, method, path, params, raw):
+        delay = self._hedge_delay(path)
+        if delay is None:
+            return self._request(method, path, params=params, raw=raw)
+        executor = self._hedge_pool()
+        send = bind_deadline(self._request)
+        pending = {executor.submit(send, method, path, params, raw=raw)}
+        done, pending = wait(pending, timeout=delay)
+        if not done:
+            get_instrumentation().count(
+                "queryduck_http_hedged_requests_total", method=method
+            )
+            pending.add(executor.submit(send, method, path, params, raw=raw))
+        error = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                raise error
+            done, pending = wait(
+                pending, timeout=remaining(), return_when=FIRST_COMPLETED
+            )
+            if not done:
+                raise DeadlineExceeded()
+
+    def _send(self, method, path, read, **kwargs):
+        """Send a request to the server, return the Requests response."""
+        import requests
+
+        return requests.request(method, "{}/{}".format(self.url, path), **kwargs)
+
+    def _request(
+        self,
+        method,
+        path,
+        params=None,
+        data=None,
+        raw=False,
+        stream=False,
+        hedge=False,
+        read=False,
+    ):
+        """Perform a request to a path and return the decoded JSON response.
+
+        If `raw` is true, the undecoded response body is returned instead. If
+        `stream` is true, the body is returned as an iterator of text chunks,
+        which are read from the connection as the iterator is consumed. If
+        `hedge` is true, the request is idempotent and can be hedged. GET
+        requests, and other requests for which `read` is true, don't modify
+        anything on the server.
+        """
+        import requests
+
+        if hedge and self.hedge_quantile is not None and not stream:
+            return self._hedged_request(method, path, params, raw)
+        instr = get_instrumentation()
+        headers = dict(self.headers)
+        body = None
+        if data is not None:
+            body, body_headers = self._encode_body(data)
+            headers.update(body_headers)
+            if instr.enabled:
+                if type(body) == bytes:
+                    instr.count(
+                        "queryduck_http_sent_bytes_total", len(body), method=method
+                    )
+                else:
+                    body = self._count_sent(body, instr, method)
+        timeout = self._timeout()
+        start = time.perf_counter()
+        try:
+            with instr.timer("queryduck_http_request_seconds", method=method):
+                r = self._send(
+                    method,
+                    path,
+                    read or method == "GET",
+                    params=params,
+                    data=body,
+                    headers=headers,
+                    auth=self.auth,
+                    stream=stream,
+                    timeout=timeout,
+                )
+        except requests.exceptions.Timeout as e:
+            if timeout is not None and timeout != self.timeout:
+                raise DeadlineExceeded() from e
+            raise
+        if self.hedge_quantile is not None:
+            self._observe_latency(path, time.perf_counter() - start)
+        if instr.enabled:
+            instr.count(
+                "queryduck_http_responses_total", method=method, status=r.status_code
+            )
+        if "Content-Encoding" in headers and self._encoding_rejected(r):
+            r.close()
+            self.compression = None
+            return self._request(method, path, params, data, raw, stream, read=read)
         self._raise_from_request(r)
-        return r.json()
+        if stream:
+            return self._iter_text(r, instr, method)
+        # The timeout only bounds every single read of the body.
+        remaining()
+        if instr.enabled:
+            instr.count(
+                "queryduck_http_received_bytes_total", len(r.content), method=method
+            )
+        if raw:
+            return r.content
+        with instr.timer("queryduck_json_decode_seconds"):
+            return r.json()
 
-    def post(self, path, data):
+    def get(self, path, params=None, raw=False, stream=False, hedge=False):
+        """Perform a GET request to a path."""
+        return self._request(
+            "GET", path, params=params, raw=raw, stream=stream, hedge=hedge
+        )
+
+    def post(self, path, data, raw=False, stream=False, read=False):
         """Perform a POST request to a path with a JSON-serialized body."""
-        r = requests.post(
-            "{}/{}".format(self.url, path), data=json.dumps(data), auth=self.auth
+        return self._request(
+            "POST", path, data=data, raw=raw, stream=stream, read=read
         )
-        self._raise_from_request(r)
-        return r.json()
 
     def put(self, path, data):
         """Perform a PUT request to a path with a JSON-serialized body."""
-        r = requests.put(
-            "{}/{}".format(self.url, path), data=json.dumps(data), auth=self.auth
-        )
-        self._raise_from_request(r)
-        return r.json()
+        return self._request("PUT", path, data=data)
 
     def delete(self, path, params=None):
         """Perform a DELETE request to a path."""
-        r = requests.delete(
-            "{}/{}".format(self.url, path), params=params, auth=self.auth
-        )
-        self._raise_from_request(r)
-        return r.json()
+        return self._request("DELETE", path, params=params)
 
 
 class Connection(APIWrapper):
+
+    batch_supported = None
+    find_files_batch_size = 200
+    max_path_params_length = 6000
+    max_parallel_requests = 4
+
     def get_schema(self, schema_uuid):
         schema = self.get("schemas/s:{}".format(schema_uuid))
         return schema
@@ -75,17 +359,44 @@ class Connection(APIWrapper):
         params = {}
         if after:
             params["after"] = after
-        results = self.get("statements", params)
+        results = self.get("statements", params, hedge=True)
         return results
 
-    def post_query(self, params, target="statement"):
-        results = self.post(f"{target}/query", params)
+    def post_query(self, params, target="statement", raw=False, stream=False):
+        results = self.post(
+            f"{target}/query", params, raw=raw, stream=stream, read=True
+        )
         return results
 
-    def get_query(self, params, target="statement"):
-        results = self.get(f"{target}/query", params)
+    def get_query(self, params, target="statement", raw=False, stream=False):
+        results = self.get(
+            f"{target}/query", params, raw=raw, stream=stream, hedge=True
+        )
         return results
 
+    def batch_query(self, param_lists, target="statement"):
+        """Perform several queries in one request and return their responses.
+
+        Falls back to one request per query if the server turns out not to
+        support batches.
+        """
+        from requests.exceptions import HTTPError
+
+        if self.batch_supported is not False:
+            try:
+                results = self.post(
+                    f"{target}/query/batch", {"queries": param_lists}, read=True
+                )
+                self.batch_supported = True
+                return results["results"]
+            except NotFoundError:
+                self.batch_supported = False
+            except HTTPError as e:
+                if e.response.status_code not in (405, 501):
+                    raise
+                self.batch_supported = False
+        return [self.get_query(params, target=target) for params in param_lists]
+
     def query(self, query=None, target="statement", after=None):
         results = self.post(
             f"{target}/query",
@@ -93,6 +404,7 @@ class Connection(APIWrapper):
                 "query": query if query else {},
                 "after": after,
             },
+            read=True,
         )
         return results
 
@@ -107,10 +419,166 @@ class Connection(APIWrapper):
     def mutate_files(self, volume_reference, files):
         self.post("volumes/{}/files".format(volume_reference), files)
 
+    def _path_batches(self, file_paths):
+        """Split paths into batches of encoded path parameters that fit in a URL."""
+        batch = []
+        length = 0
+        for p in file_paths:
+            encoded = urlsafe_b64encode(os.fsencode(p))
+            if batch and (
+                len(batch) >= self.find_files_batch_size
+                or length + len(encoded) > self.max_path_params_length
+            ):
+                yield batch
+                batch = []
+                length = 0
+            batch.append(("path", encoded))
+            length += len(encoded) + len("&path=")
+        if batch:
+            yield batch
+
     def find_files(self, volume_reference, file_paths):
-        params = [
-            ("path", urlsafe_b64encode(str(p).encode("utf-8"))) for p in file_paths
-        ]
-        results = self.get("volumes/{}/files".format(volume_reference), params)
-        files = {row["path"]: row for row in results["results"]}
+        """Return the file records of a volume for the given paths, by path.
+
+        Paths can be str, bytes or path-like. Large sets of paths are split
+        into batches, which are requested concurrently.
+        """
+        path = "volumes/{}/files".format(volume_reference)
+        batches = list(self._path_batches(file_paths))
+        if len(batches) <= 1:
+            responses = [self.get(path, params) for params in batches]
+        else:
+            fetch = bind_deadline(lambda p: self.get(path, p))
+            with ThreadPoolExecutor(max_workers=self.max_parallel_requests) as executor:
+                responses = list(executor.map(fetch, batches))
+        files = {}
+        for results in responses:
+            files.update({row["path"]: row for row in results["results"]})
         return files
+
+
+class Endpoint:
+    """A server that a ReplicatedConnection sends requests to."""
+
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.latency = None
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    def __repr__(self):
+        return "<Endpoint url={} outstanding={} latency={}>".format(
+            self.url, self.outstanding, self.latency
+        )
+
+
+class ReplicatedConnection(Connection):
+    """Connection to a primary server and any number of read replicas.
+
+    Requests that modify data always go to the primary. Reads are spread
+    over all endpoints, picking the one with the fewest outstanding requests
+    ("least_outstanding") or the lowest expected latency given its
+    outstanding requests ("latency"). A read that can't reach its endpoint,
+    or gets a server error, is retried on the next best one.
+
+    An endpoint that fails `eject_after` requests in a row is ejected for
+    `eject_seconds`, after which it gets another chance. If all endpoints
+    are ejected, all of them are tried.
+    """
+
+    # Weight of the newest sample in the moving average of endpoint latencies.
+    latency_decay = 0.2
+
+    def __init__(
+        self,
+        url,
+        replica_urls,
+        username,
+        password,
+        balancing="least_outstanding",
+        eject_after=3,
+        eject_seconds=30.0,
+        **kwargs
+    ):
+        super().__init__(url, username, password, **kwargs)
+        if balancing not in ("least_outstanding", "latency"):
+            raise ValueError("Unknown balancing method: {}".format(balancing))
+        self.primary = Endpoint(url)
+        self.endpoints = [self.primary] + [Endpoint(u) for u in replica_urls]
+        self.balancing = balancing
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self._endpoint_lock = threading.Lock()
+
+    def _load(self, endpoint):
+        if self.balancing == "latency":
+            return (endpoint.latency or 0.0) * (endpoint.outstanding + 1)
+        return endpoint.outstanding
+
+    def _candidates(self, read):
+        """Return the endpoints to try for a request, best first."""
+        if not read:
+            return [self.primary]
+        now = time.monotonic()
+        with self._endpoint_lock:
+            endpoints = [e for e in self.endpoints if e.ejected_until <= now]
+            if not endpoints:
+                endpoints = list(self.endpoints)
+            random.shuffle(endpoints)
+            endpoints.sort(key=self._load)
+        return endpoints
+
+    def _record(self, endpoint, latency):
+        """Record the latency of a request, or its failure if latency is None."""
+        with self._endpoint_lock:
+            if latency is not None:
+                endpoint.failures = 0
+                if endpoint.latency is None:
+                    endpoint.latency = latency
+                else:
+                    delta = latency - endpoint.latency
+                    endpoint.latency += self.latency_decay * delta
+                return
+            endpoint.failures += 1
+            if endpoint.failures >= self.eject_after:
+                endpoint.failures = 0
+                endpoint.ejected_until = time.monotonic() + self.eject_seconds
+                get_instrumentation().count(
+                    "queryduck_endpoint_ejections_total", endpoint=endpoint.url
+                )
+
+    def _send(self, method, path, read, **kwargs):
+        import requests
+
+        candidates = self._candidates(read)
+        # Compressed bodies are generators, which can only be sent once.
+        retryable = read and type(kwargs.get("data")) in (bytes, type(None))
+        for idx, endpoint in enumerate(candidates):
+            last = not retryable or idx == len(candidates) - 1
+            with self._endpoint_lock:
+                endpoint.outstanding += 1
+            start = time.perf_counter()
+            try:
+                r = requests.request(
+                    method, "{}/{}".format(endpoint.url, path), **kwargs
+                )
+            except requests.exceptions.Timeout:
+                # Retrying would overrun the timeout.
+                self._record(endpoint, None)
+                raise
+            except requests.exceptions.ConnectionError:
+                self._record(endpoint, None)
+                if last:
+                    raise
+                continue
+            finally:
+                with self._endpoint_lock:
+                    endpoint.outstanding -= 1
+            if r.status_code < 500:
+                self._record(endpoint, time.perf_counter() - start)
+                return r
+            self._record(endpoint, None)
+            if last:
+                return r
+            r.close()
@@ -1,25 +1,101 @@
-from .collection import grouped_statement_generator, BaseCollection, GroupedCollection
+import time
+
+from .collection import (
+    grouped_statement_generator,
+    BaseCollection,
+    BoundedGroupedCollection,
+    GroupedCollection,
+)
+from .deadlines import deadline
+from .evaluator import QueryEvaluator
+from .expansion import NeighborhoodExpander
 from .query import Main, QDQuery
 from .transaction import Transaction
 from .types import Statement
 
 class Context(BaseCollection):
-    def __init__(self, repo, bindings, coll=None, transaction=None):
+    def __init__(
+        self,
+        repo,
+        bindings,
+        coll=None,
+        transaction=None,
+        max_statements=None,
+        max_bytes=None,
+        timeout=None,
+    ):
+        """Create a Context.
+
+        If `max_statements` or `max_bytes` is given, the least recently used
+        query results are dropped when the Context grows past that size.
+        Results containing statements the pending Transaction refers to are
+        always kept.
+
+        If `timeout` is given, all requests made through the Context have to
+        complete within that many seconds of its creation. Individual calls
+        can have a shorter `timeout` of their own.
+        """
         self.repo = repo
+        self.deadline = None if timeout is None else time.monotonic() + timeout
         self.bindings = bindings
-        self.coll = GroupedCollection()
+        self.transaction = transaction if transaction else Transaction()
+        if max_statements is not None or max_bytes is not None:
+            self.coll = BoundedGroupedCollection(
+                max_statements=max_statements,
+                max_bytes=max_bytes,
+                pinned=self._is_pinned,
+            )
+        else:
+            self.coll = GroupedCollection()
         if coll:
             self.coll.add_collection(coll)
-        self.transaction = transaction if transaction else Transaction()
+
+    def _is_pinned(self, collection):
+        statements = getattr(collection, "statements", {})
+        for st in self.transaction.statements:
+            for v in st.triple:
+                if type(v) == Statement and v.handle in statements:
+                    return True
+        return False
 
     def get_bc(self):
         return self.bindings, self.coll
 
-    def execute(self, query, post_query=False):
-        result, collection = self.repo.execute(query, post_query=post_query)
+    def _deadline(self):
+        return deadline(
+            None if self.deadline is None else self.deadline - time.monotonic()
+        )
+
+    def execute(self, query, post_query=False, timeout=None):
+        with self._deadline():
+            result, collection = self.repo.execute(
+                query, post_query=post_query, timeout=timeout
+            )
         self.coll.add_collection(collection)
         return result
 
+    def execute_batch(self, queries, timeout=None):
+        results = []
+        with self._deadline():
+            batch = self.repo.execute_batch(queries, timeout=timeout)
+        for result, collection in batch:
+            self.coll.add_collection(collection)
+            results.append(result)
+        return results
+
+    def expand(self, values, depth, max_nodes=10000, timeout=None):
+        """Fetch the neighborhood of values, up to depth hops away."""
+        expander = NeighborhoodExpander(self.repo, max_nodes)
+        with self._deadline(), deadline(timeout):
+            collection = expander.expand(values, depth, self.bindings.reverse_exists)
+        self.coll.add_collection(collection)
+        return collection
+
+    def execute_local(self, query):
+        """Execute a query against the statements already in this Context."""
+        result, collection = QueryEvaluator(self).execute(query)
+        return result
+
     def add(self, s, p, o):
         return self.transaction.add(s, p, o)
 
@@ -29,8 +105,9 @@ class Context(BaseCollection):
             return None
         return self.transaction.ensure(s, p, o)
 
-    def submit(self):
-        self.repo.submit(self.transaction)
+    def submit(self, timeout=None):
+        with self._deadline():
+            self.repo.submit(self.transaction, timeout=timeout)
 
     def parse_identifier(self, identifier):
         if ":" in identifier:
@@ -56,7 +133,7 @@ class Context(BaseCollection):
             return self.repo.unique_deserialize(string)
 
     def find(self, s=None, p=None, o=None):
-        return grouped_statement_generator(self.coll.collections + [self.transaction], s, p, o)
+        return grouped_statement_generator([self.coll, self.transaction], s, p, o)
 
     def get_files(self, blob):
         return self.coll.get_files(blob)
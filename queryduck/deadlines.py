@@ -0,0 +1,64 @@
+"""Deadlines for the requests made while executing a call.
+
+A deadline is set for a block of code with the `deadline` context manager,
+and applies to every request made inside it, however deep in the call
+stack. Nested deadlines can only shorten the deadline that is in effect.
+Work handed to other threads keeps its deadline if it is wrapped with
+`bind_deadline`.
+"""
+import contextvars
+import time
+
+from contextlib import contextmanager
+
+from .exceptions import DeadlineExceeded
+
+_deadline = contextvars.ContextVar("queryduck_deadline", default=None)
+
+
+@contextmanager
+def deadline(timeout):
+    """Fail requests made in this block that don't finish within timeout seconds.
+
+    A timeout of None sets no deadline.
+    """
+    if timeout is None:
+        yield
+        return
+    at = time.monotonic() + timeout
+    current = _deadline.get()
+    if current is not None and current < at:
+        at = current
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Return the number of seconds left before the deadline, or None.
+
+    Raises DeadlineExceeded if the deadline has already passed.
+    """
+    at = _deadline.get()
+    if at is None:
+        return None
+    left = at - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded()
+    return left
+
+
+def bind_deadline(func):
+    """Wrap func to run under the current deadline, in whatever thread."""
+    at = _deadline.get()
+
+    def wrapper(*args, **kwargs):
+        token = _deadline.set(at)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _deadline.reset(token)
+
+    return wrapper
@@ -0,0 +1,47 @@
+"""Decoding of large query responses in worker processes.
+
+A worker parses the response body and replaces every serialized value by an
+index into a list of distinct values. The parent process then only has to
+deserialize each distinct value once, and can rebuild the Statements from
+compact integer arrays.
+"""
+import json
+
+from array import array
+
+
+class InternedResponse:
+    """A query response in which all values are indexes into `values`."""
+
+    def __init__(self, values, statements, references, files):
+        self.values = values
+        # Flat array of (handle, subject, predicate, object) value indexes
+        self.statements = statements
+        self.references = references
+        # List of (blob index, array of file indexes)
+        self.files = files
+
+
+def decode_response_body(body):
+    """Parse a serialized query response into an InternedResponse."""
+    response = json.loads(body)
+    index = {}
+    values = []
+
+    def intern(v):
+        i = index.get(v)
+        if i is None:
+            i = index[v] = len(values)
+            values.append(v)
+        return i
+
+    statements = array("l")
+    for k, triple in response["statements"].items():
+        statements.append(intern(k))
+        statements.extend(intern(v) for v in triple)
+    references = array("l", (intern(r) for r in response["references"]))
+    files = [
+        (intern(k), array("l", (intern(f) for f in v)))
+        for k, v in response.get("files", {}).items()
+    ]
+    return InternedResponse(values, statements, references, files)
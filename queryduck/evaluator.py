@@ -0,0 +1,368 @@
+from functools import cmp_to_key
+
+from .collection import Collection
+from .constants import Component
+from .query import (
+    AfterTuple,
+    Equals,
+    FetchEntity,
+    Filter,
+    Having,
+    HavingEquals,
+    HavingGreater,
+    HavingGreaterEqual,
+    HavingIsNull,
+    HavingLess,
+    HavingLessEqual,
+    HavingNotEquals,
+    HavingNotNull,
+    InList,
+    IsNull,
+    JoinEntity,
+    Main,
+    MatchFile,
+    NotEquals,
+    NotNull,
+    Order,
+    OrderDescending,
+    Prefer,
+    PreferMax,
+    QueryEntity,
+    Greater,
+    GreaterEqual,
+    Less,
+    LessEqual,
+)
+from .types import Blob, Statement, value_types, value_types_by_native
+
+
+def value_key(value):
+    """Return a hashable key under which equal values compare equal.
+
+    Statements and Blobs are compared by handle, so instances that did not go
+    through the same StatementRepository still match. Values that have no
+    handle yet (e.g. Transaction statements) are compared by identity.
+    """
+    t = type(value)
+    if t in (Statement, Blob):
+        return (t, id(value) if value.handle is None else value.handle)
+    return (value_types_by_native.get(t, t), value)
+
+
+def values_equal(lhs, rhs):
+    if lhs is None or rhs is None:
+        return False
+    return value_key(lhs) == value_key(rhs)
+
+
+def values_compare(lhs, rhs):
+    """Compare two values of the same value type, like the server would.
+
+    Returns None if the values can't be compared, otherwise -1, 0 or 1.
+    """
+    if lhs is None or rhs is None or type(lhs) != type(rhs):
+        return None
+    if type(lhs) in (Statement, Blob):
+        return None
+    return (lhs > rhs) - (lhs < rhs)
+
+
+def sort_identity(value):
+    if type(value) in (Statement, Blob) and value.handle is not None:
+        return (0, value.handle)
+    return (1, id(value))
+
+
+comparison_checks = {
+    Less: lambda c: c < 0,
+    LessEqual: lambda c: c <= 0,
+    Greater: lambda c: c > 0,
+    GreaterEqual: lambda c: c >= 0,
+    HavingLess: lambda c: c < 0,
+    HavingLessEqual: lambda c: c <= 0,
+    HavingGreater: lambda c: c > 0,
+    HavingGreaterEqual: lambda c: c >= 0,
+}
+
+
+class Binding:
+    """The statement a query entity is joined to, and the value it provides."""
+
+    __slots__ = ("row", "value")
+
+    def __init__(self, row, value):
+        self.row = row
+        self.value = value
+
+
+empty_binding = Binding(None, None)
+
+
+class QueryEvaluator:
+    """Evaluate a QDQuery against a local collection instead of the server.
+
+    Semantics follow the server's SQL implementation:
+
+    - `Main` is bound to the candidate Statement (or Blob) itself.
+    - A join is bound to each Statement that links its target through one of
+      its predicates (any predicate if none are given). `ObjectFor` and
+      `ObjectMeta` match on the subject and provide the object as value,
+      `SubjectFor` and `SubjectMeta` match on the object and provide the
+      subject. Regular joins link to the target's value, meta joins link to
+      the Statement the target is bound to.
+    - Joins are outer joins: an entity without matches is NULL, which only
+      satisfies `IsNull`.
+    - Comparisons against NULL or values of another type are false.
+    - `Prefer` keeps only the joined rows with the minimum or maximum value of
+      the given value type, `Having` compares the number of distinct values an
+      entity takes for a result.
+    - Results are distinct, ordered by the `Order` elements (NULLs last when
+      ascending, first when descending) and then by handle, and cut off at the
+      query's limit.
+    - `FetchEntity` on `Main` adds all Statements about the result to the
+      returned Collection, on a join it adds the joined Statements.
+    """
+
+    def __init__(self, coll):
+        self.coll = coll
+
+    def execute(self, query):
+        main = query.joins.get("main")
+        if main is None:
+            main = Main(query.target)
+            main.key = "main"
+        joins = [e for e in query.elements if isinstance(e, JoinEntity)]
+        positions = {main.key: 0}
+        positions.update({j.key: i + 1 for i, j in enumerate(joins)})
+
+        filters = [[] for i in range(len(joins) + 1)]
+        for f in query.elements:
+            if isinstance(f, Filter):
+                entities = [o for o in f.get_operands() if isinstance(o, QueryEntity)]
+                filters[max([positions[e.key] for e in entities] + [0])].append(f)
+        prefers = {}
+        for p in query.elements:
+            if isinstance(p, Prefer):
+                prefers.setdefault(p.by.key, []).append(p)
+        havings = [e for e in query.elements if isinstance(e, Having)]
+        orders = [e for e in query.elements if isinstance(e, Order)]
+        fetches = [e for e in query.elements if isinstance(e, FetchEntity)]
+        afters = [e for e in query.elements if isinstance(e, AfterTuple)]
+
+        matches = []
+        for candidate in self._candidates(query, main):
+            bindings = {main.key: Binding(candidate, candidate)}
+            if not self._check_filters(filters[0], bindings):
+                continue
+            rows = list(self._expand(joins, 0, bindings, filters, prefers))
+            if rows and all(self._check_having(h, rows) for h in havings):
+                matches.append((candidate, rows))
+
+        def compare(a, b):
+            for order, lhs, rhs in zip(orders, a[0], b[0]):
+                c = self._compare_order_values(order, lhs, rhs)
+                if c:
+                    return c
+            return (a[1] > b[1]) - (a[1] < b[1])
+
+        ordered = []
+        for candidate, rows in matches:
+            keyed = [(self._order_key(orders, r), sort_identity(candidate), r) for r in rows]
+            best = min(keyed, key=cmp_to_key(compare)) if orders else keyed[0]
+            ordered.append((best, candidate, rows))
+        ordered.sort(key=lambda e: cmp_to_key(compare)(e[0]))
+
+        if afters:
+            after = afters[-1].values
+            ordered = [
+                e for e in ordered
+                if self._after(orders, e[0][0], e[1], after)
+            ]
+
+        ordered = ordered[:query.limit]
+        results = [candidate for best, candidate, rows in ordered]
+        return results, self._result_collection(query, main, fetches, ordered)
+
+    def _candidates(self, query, main):
+        seeds = None
+        for f in query.elements:
+            if isinstance(f, (Equals, InList)):
+                found = self._seed_candidates(f, main)
+                if found is not None and (seeds is None or len(found) < len(seeds)):
+                    seeds = found
+        if seeds is None:
+            seeds = self._all_values(main.value_type)
+        seen = set()
+        for v in seeds:
+            if type(v) != main.value_type:
+                continue
+            k = value_key(v)
+            if k not in seen:
+                seen.add(k)
+                yield v
+
+    def _seed_candidates(self, filter_, main):
+        """Use the collection's indexes to find candidates for a filter."""
+        if isinstance(filter_, Equals):
+            values = [filter_.rhs]
+        else:
+            values = filter_.rhs
+        entity = filter_.lhs
+        if any(isinstance(v, QueryEntity) for v in values):
+            return None
+        if entity is main:
+            return list(values)
+        if (
+            not isinstance(entity, JoinEntity)
+            or entity.target is not main
+            or not entity.predicates
+        ):
+            return None
+        found = []
+        for v in values:
+            for p in entity.predicates:
+                if entity.value_component == Component.OBJECT:
+                    found += [st.triple[0] for st in self.coll.find(p=p, o=v)]
+                else:
+                    found += [st.triple[2] for st in self.coll.find(s=v, p=p)]
+        return found
+
+    def _all_values(self, value_type):
+        values = {}
+        for st in self.coll.find():
+            for v in (st,) + tuple(st.triple):
+                if type(v) == value_type:
+                    values.setdefault(value_key(v), v)
+        return values.values()
+
+    def _expand(self, joins, idx, bindings, filters, prefers):
+        if idx == len(joins):
+            yield dict(bindings)
+            return
+        join = joins[idx]
+        target = bindings[join.target.key]
+        for binding in self._join_bindings(join, target, prefers.get(join.key, [])):
+            bindings[join.key] = binding
+            if self._check_filters(filters[idx + 1], bindings):
+                yield from self._expand(joins, idx + 1, bindings, filters, prefers)
+        del bindings[join.key]
+
+    def _join_bindings(self, join, target, prefers):
+        source = target.row if join.meta else target.value
+        if source is None:
+            return [empty_binding]
+        predicates = join.predicates if join.predicates else [None]
+        rows = {}
+        for p in predicates:
+            if join.value_component == Component.OBJECT:
+                found = self.coll.find(s=source, p=p)
+            else:
+                found = self.coll.find(p=p, o=source)
+            for st in found:
+                rows.setdefault(id(st), st)
+
+        if join.value_component == Component.OBJECT:
+            bindings = [Binding(st, st.triple[2]) for st in rows.values()]
+        else:
+            bindings = [Binding(st, st.triple[0]) for st in rows.values()]
+
+        for prefer in prefers:
+            vtype = value_types[prefer.vtype]["type"]
+            typed = [b for b in bindings if type(b.value) == vtype]
+            if typed:
+                pick = max if isinstance(prefer, PreferMax) else min
+                best = pick(b.value for b in typed)
+                bindings = [b for b in typed if b.value == best]
+        return bindings if bindings else [empty_binding]
+
+    def _resolve(self, operand, bindings):
+        if isinstance(operand, QueryEntity):
+            return bindings[operand.key].value
+        return operand
+
+    def _check_filters(self, filters, bindings):
+        return all(self._check_filter(f, bindings) for f in filters)
+
+    def _check_filter(self, f, bindings):
+        if isinstance(f, IsNull):
+            return self._resolve(f.operand, bindings) is None
+        elif isinstance(f, NotNull):
+            return self._resolve(f.operand, bindings) is not None
+        lhs = self._resolve(f.lhs, bindings)
+        if isinstance(f, InList):
+            return any(values_equal(lhs, self._resolve(v, bindings)) for v in f.rhs)
+        rhs = self._resolve(f.rhs, bindings)
+        if isinstance(f, Equals):
+            return values_equal(lhs, rhs)
+        elif isinstance(f, NotEquals):
+            return lhs is not None and rhs is not None and not values_equal(lhs, rhs)
+        elif isinstance(f, MatchFile):
+            return type(lhs) == Blob and any(
+                fl.volume == rhs.volume and fl.path == rhs.path
+                for fl in self.coll.get_files(lhs)
+            )
+        c = values_compare(lhs, rhs)
+        return c is not None and comparison_checks[type(f)](c)
+
+    def _check_having(self, having, rows):
+        key = having.get_operands()[0].key
+        values = {value_key(r[key].value) for r in rows if r[key].value is not None}
+        count = len(values)
+        if isinstance(having, HavingIsNull):
+            return count == 0
+        elif isinstance(having, HavingNotNull):
+            return count > 0
+        elif isinstance(having, HavingEquals):
+            return count == having.rhs
+        elif isinstance(having, HavingNotEquals):
+            return count != having.rhs
+        return comparison_checks[type(having)]((count > having.rhs) - (count < having.rhs))
+
+    def _order_key(self, orders, row):
+        key = []
+        for order in orders:
+            v = row[order.by.key].value
+            key.append(v if type(v) == value_types[order.vtype]["type"] else None)
+        return tuple(key)
+
+    def _compare_order_values(self, order, lhs, rhs):
+        desc = isinstance(order, OrderDescending)
+        if lhs is None or rhs is None:
+            if lhs is None and rhs is None:
+                return 0
+            c = 1 if lhs is None else -1
+            return -c if desc else c
+        c = values_compare(lhs, rhs)
+        return -c if desc else c
+
+    def _after(self, orders, key, candidate, after):
+        for order, v, a in zip(orders, key, after):
+            c = self._compare_order_values(order, v, a)
+            if c:
+                return c > 0
+        if len(after) > len(orders):
+            return sort_identity(candidate) > sort_identity(after[len(orders)])
+        return False
+
+    def _result_collection(self, query, main, fetches, ordered):
+        statements = {}
+        files = {}
+
+        def add(st):
+            if st.triple is not None:
+                statements[st.handle if st.handle is not None else st] = st
+
+        for best, candidate, rows in ordered:
+            if type(candidate) == Statement:
+                add(candidate)
+            elif type(candidate) == Blob:
+                files[candidate] = self.coll.get_files(candidate)
+            for fetch in fetches:
+                if fetch.operand is main or fetch.operand.key == main.key:
+                    [add(st) for st in self.coll.find(s=candidate)]
+                    continue
+                for r in rows:
+                    row = r[fetch.operand.key].row
+                    if row is not None:
+                        add(row)
+        return Collection(statements=statements, files=files)
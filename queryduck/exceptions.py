@@ -22,3 +22,7 @@ class QDValueError(Exception):
 
 class QDSchemaError(Exception):
     """Something went wrong related to Schemas"""
+
+
+class DeadlineExceeded(Exception):
+    """Exception to be raised when a request can't complete before its deadline."""
@@ -0,0 +1,79 @@
+from .collection import Collection
+from .evaluator import value_key
+from .query import Main, QDQuery
+from .types import Statement
+
+
+class NeighborhoodExpander:
+    """Fetch the k-hop neighborhood of Statements in breadth-first rounds.
+
+    Every round fetches, for the whole frontier at once, the statements about
+    the frontier (outgoing) and the statements referring to it (incoming),
+    each with a single InList query. Nodes are visited only once, and no new
+    nodes are added to the frontier once `max_nodes` have been visited.
+
+    The limit of a query isn't sent to the server, which applies its default
+    limit instead, so the frontier is queried in batches of at most
+    `batch_size` nodes, and only the statements about and referring to the
+    batch are kept from every response.
+    """
+
+    # The server's default limit
+    batch_size = 1000
+
+    def __init__(self, repo, max_nodes=10000):
+        self.repo = repo
+        self.max_nodes = max_nodes
+
+    def _outgoing_query(self, frontier):
+        m = Main(Statement)
+        q = QDQuery(Statement).add(m.in_list(frontier), m.fetch())
+        q.limit = len(frontier)
+        return q
+
+    def _incoming_query(self, frontier):
+        m = Main(Statement)
+        q = QDQuery(Statement).add(m.in_list(frontier), m.subject_for().fetch())
+        q.limit = len(frontier)
+        return q
+
+    def _hop(self, batch):
+        """Fetch the statements about and referring to a batch of nodes."""
+        keys = {value_key(v) for v in batch}
+        statements = {}
+        for query in (self._outgoing_query(batch), self._incoming_query(batch)):
+            results, result_coll = self.repo.execute(query)
+            for handle, st in result_coll.statements.items():
+                if any(value_key(v) in keys for v in (st, st.triple[0], st.triple[2])):
+                    statements[handle] = st
+        return statements
+
+    def expand(self, values, depth, skip=None):
+        """Return a Collection with all statements within `depth` hops of values.
+
+        Nodes for which `skip` returns true are included in the result, but
+        their own neighborhood is not fetched.
+        """
+        coll = Collection()
+        frontier = [v for v in values if type(v) == Statement]
+        visited = {value_key(v) for v in frontier}
+        for level in range(depth):
+            if not frontier:
+                break
+            statements = {}
+            for i in range(0, len(frontier), self.batch_size):
+                statements.update(self._hop(frontier[i : i + self.batch_size]))
+            coll.add_statements(statements)
+
+            frontier = []
+            for st in statements.values():
+                for v in (st.triple[0], st.triple[2]):
+                    if type(v) != Statement or len(visited) >= self.max_nodes:
+                        continue
+                    key = value_key(v)
+                    if key in visited:
+                        continue
+                    visited.add(key)
+                    if skip is None or not skip(v):
+                        frontier.append(v)
+        return coll
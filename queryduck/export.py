@@ -0,0 +1,150 @@
+import bz2
+import gzip
+import json
+import lzma
+import os
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+compressors = {
+    ".gz": lambda f, mode: gzip.GzipFile(fileobj=f, mode=mode),
+    ".xz": lambda f, mode: lzma.LZMAFile(f, mode),
+    ".bz2": lambda f, mode: bz2.BZ2File(f, mode),
+}
+
+
+def _compressor_for(path):
+    ext = os.path.splitext(str(path))[1]
+    return compressors.get(ext)
+
+
+class StatementExporter:
+    """Export all statements to an NDJSON file, one serialized statement per line.
+
+    The file is compressed according to its extension (.gz, .xz or .bz2).
+    Every page of statements is written as a separate compressed stream, after
+    which a checkpoint containing the cursor and the file size is stored. An
+    interrupted export is resumed by truncating the file to the last checkpoint
+    and continuing from its cursor.
+    """
+
+    def __init__(self, repo, path, checkpoint_path=None):
+        self.repo = repo
+        self.path = path
+        self.checkpoint_path = (
+            checkpoint_path if checkpoint_path else "{}.checkpoint".format(path)
+        )
+        self.compressor = _compressor_for(path)
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save_checkpoint(self, checkpoint):
+        tmp_path = "{}.tmp".format(self.checkpoint_path)
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _write_page(self, f, statements):
+        lines = "".join(json.dumps(s) + "\n" for s in statements).encode("utf-8")
+        if self.compressor:
+            with self.compressor(f, "wb") as c:
+                c.write(lines)
+        else:
+            f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+    def export(self, resume=True):
+        """Write all statements to the file and return the number written."""
+        checkpoint = self._load_checkpoint() if resume else None
+        if checkpoint is None:
+            checkpoint = {"after": None, "offset": 0, "count": 0}
+
+        with open(self.path, "ab") as f:
+            f.truncate(checkpoint["offset"])
+            f.seek(checkpoint["offset"])
+            for statements, after in self.repo.iter_statement_pages(
+                after=checkpoint["after"]
+            ):
+                self._write_page(f, statements)
+                checkpoint = {
+                    "after": after,
+                    "offset": f.tell(),
+                    "count": checkpoint["count"] + len(statements),
+                }
+                self._save_checkpoint(checkpoint)
+        return checkpoint["count"]
+
+
+class StatementImporter:
+    """Import statements from a file written by StatementExporter.
+
+    The file is read in chunks of `chunk_size` statements, of which at most
+    `parallelism` are uploaded concurrently. No more than twice that number of
+    chunks is held in memory at any time. A chunk that refers to statements
+    of a chunk still being uploaded is only uploaded once that chunk is
+    committed. Statements must not refer to statements later in the file,
+    which the export never produces.
+    """
+
+    def __init__(self, repo, path, chunk_size=1000, parallelism=4):
+        self.repo = repo
+        self.path = path
+        self.chunk_size = chunk_size
+        self.parallelism = parallelism
+        self.compressor = _compressor_for(path)
+
+    def _read_chunks(self):
+        with open(self.path, "rb") as raw:
+            f = self.compressor(raw, "rb") if self.compressor else raw
+            chunk = []
+            for line in f:
+                if line.strip():
+                    chunk.append(json.loads(line))
+                if len(chunk) >= self.chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+    def _finish(self, done, pending, uploading):
+        for future in done:
+            future.result()
+            for handle in pending.pop(future):
+                if uploading.get(handle) is future:
+                    del uploading[handle]
+
+    def run(self):
+        """Upload all statements in the file and return the number uploaded."""
+        count = 0
+        # Future of every chunk being uploaded -> handles of its statements
+        pending = {}
+        # Handle -> future of the chunk uploading it
+        uploading = {}
+        with ThreadPoolExecutor(max_workers=self.parallelism) as executor:
+            for chunk in self._read_chunks():
+                handles = [row[0] for row in chunk]
+                required = set(
+                    uploading[v] for row in chunk for v in row[1:] if v in uploading
+                )
+                if required:
+                    done, not_done = wait(required)
+                    self._finish(done, pending, uploading)
+                while len(pending) >= self.parallelism * 2:
+                    done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                    self._finish(done, pending, uploading)
+                future = executor.submit(self.repo.import_statements, chunk)
+                pending[future] = handles
+                uploading.update((h, future) for h in handles)
+                count += len(chunk)
+            done, not_done = wait(pending)
+            self._finish(done, pending, uploading)
+        return count
@@ -0,0 +1,265 @@
+import mmap
+import os
+import struct
+
+from array import array
+
+from .collection import BaseCollection
+from .serialization import serialize
+
+MAGIC = b"QDFROZN1"
+# Magic, number of values, size of the value data, number of statements,
+# number of blobs with files, number of files.
+HEADER = struct.Struct("=8s5Q")
+
+# Sort orders of the statement indexes, and the positions of the
+# (handle, subject, predicate, object) columns they are sorted on.
+ORDERS = (
+    ("spo", (1, 2, 3)),
+    ("pos", (2, 3, 1)),
+    ("osp", (3, 1, 2)),
+)
+
+
+def _aligned(size):
+    return (size + 7) & ~7
+
+
+def _layout(num_values, value_bytes, num_statements, num_blobs, num_files):
+    """Return the (offset, size) of every section of a frozen collection."""
+    sizes = [
+        ("value_offsets", (num_values + 1) * 8),
+        ("value_data", value_bytes),
+        ("statements", num_statements * 16),
+    ]
+    sizes += [(name, num_statements * 4) for name, columns in ORDERS]
+    sizes += [
+        ("file_blobs", num_blobs * 4),
+        ("file_offsets", (num_blobs + 1) * 4),
+        ("file_values", num_files * 4),
+    ]
+    sections = {}
+    offset = _aligned(HEADER.size)
+    for name, size in sizes:
+        sections[name] = (offset, size)
+        offset += _aligned(size)
+    return sections, offset
+
+
+def freeze_collection(coll, path):
+    """Write a Collection to path in the layout read by FrozenCollection.
+
+    The file is written next to path and then moved into place, so processes
+    attaching to path never see a partially written file.
+    """
+    rows = [
+        [serialize(v) for v in (st,) + tuple(st.triple)]
+        for st in coll.statements.values()
+    ]
+    ser_files = [
+        (serialize(blob), [serialize(f) for f in files])
+        for blob, files in coll.files.items()
+    ]
+    values = set(v for row in rows for v in row)
+    for blob, files in ser_files:
+        values.add(blob)
+        values.update(files)
+    values = sorted(v.encode("utf-8") for v in values)
+    value_index = {v.decode("utf-8"): i for i, v in enumerate(values)}
+
+    value_offsets = array("Q", [0])
+    for v in values:
+        value_offsets.append(value_offsets[-1] + len(v))
+
+    rows = sorted([value_index[v] for v in row] for row in rows)
+    statements = array("I", (i for row in rows for i in row))
+    orders = []
+    for name, columns in ORDERS:
+        order = sorted(
+            range(len(rows)), key=lambda i: tuple(rows[i][c] for c in columns)
+        )
+        orders.append((name, array("I", order)))
+
+    ser_files = sorted(
+        (value_index[blob], [value_index[f] for f in files])
+        for blob, files in ser_files
+    )
+    file_blobs = array("I", (blob for blob, files in ser_files))
+    file_offsets = array("I", [0])
+    file_values = array("I")
+    for blob, files in ser_files:
+        file_values.extend(files)
+        file_offsets.append(len(file_values))
+
+    counts = (
+        len(values),
+        value_offsets[-1],
+        len(rows),
+        len(file_blobs),
+        len(file_values),
+    )
+    sections, size = _layout(*counts)
+    contents = [
+        ("value_offsets", value_offsets),
+        ("value_data", b"".join(values)),
+        ("statements", statements),
+    ]
+    contents += orders
+    contents += [
+        ("file_blobs", file_blobs),
+        ("file_offsets", file_offsets),
+        ("file_values", file_values),
+    ]
+
+    tmp_path = "{}.tmp".format(path)
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, *counts))
+        for name, data in contents:
+            f.seek(sections[name][0])
+            f.write(data)
+        f.truncate(size)
+    os.replace(tmp_path, path)
+
+
+class FrozenCollection(BaseCollection):
+    """Read-only Collection backed by a memory-mapped file.
+
+    The file is written by `freeze_collection` and holds the sorted
+    serialized values, the statements as rows of value indexes and three
+    sorted permutations of them that serve as the index. Every process that
+    attaches to the same file shares its pages, and nothing is deserialized
+    until a statement is returned from `find`. Put the file on a tmpfs such
+    as /dev/shm to keep it in shared memory.
+
+    Values are stored in native byte order, so a frozen collection can only
+    be read on machines with the byte order it was written on.
+    """
+
+    def __init__(self, repo, path):
+        self.repo = repo
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        magic, *counts = HEADER.unpack_from(self._buffer)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("{} is not a frozen collection".format(path))
+        self.num_statements = counts[2]
+        sections, size = _layout(*counts)
+        formats = {"value_offsets": "Q", "value_data": "B"}
+        for name, (offset, length) in sections.items():
+            view = self._buffer[offset : offset + length].cast(formats.get(name, "I"))
+            setattr(self, "_" + name, view)
+
+    def close(self):
+        for name in list(vars(self)):
+            if isinstance(getattr(self, name), memoryview):
+                getattr(self, name).release()
+        self._mmap.close()
+
+    def __len__(self):
+        return self.num_statements
+
+    def _value(self, idx):
+        start, end = self._value_offsets[idx], self._value_offsets[idx + 1]
+        return str(self._value_data[start:end], "utf-8")
+
+    def _value_index(self, value):
+        """Return the index of a value, or None if it doesn't occur."""
+        try:
+            ser_value = serialize(value)
+        except KeyError:
+            return None
+        return self._ser_index(ser_value)
+
+    def _ser_index(self, ser_value):
+        target = ser_value.encode("utf-8")
+        offsets, data = self._value_offsets, self._value_data
+        lo, hi = 0, len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if data[offsets[mid] : offsets[mid + 1]].tobytes() < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(offsets) - 1 and data[offsets[lo] : offsets[lo + 1]] == target:
+            return lo
+        return None
+
+    def _statement(self, row):
+        ser = [self._value(i) for i in self._statements[row * 4 : row * 4 + 4]]
+        statement = self.repo.unique_deserialize(ser[0])
+        if not statement.complete:
+            statement.set_raw_triple(ser[1:], self.repo.unique_deserialize)
+        return statement
+
+    def _bound(self, order, columns, prefix, upper):
+        """Binary search the first position in order whose key exceeds prefix.
+
+        With `upper` false, the first position whose key is at least prefix.
+        """
+        statements = self._statements
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            row = order[mid] * 4
+            key = tuple(statements[row + c] for c in columns[: len(prefix)])
+            if key < prefix or (upper and key == prefix):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _range(self, name, columns, prefix):
+        order = getattr(self, "_" + name)
+        start = self._bound(order, columns, prefix, False)
+        end = self._bound(order, columns, prefix, True)
+        return [self._statement(row) for row in order[start:end]]
+
+    def get(self, uuid_):
+        idx = self._ser_index("s:{}".format(uuid_))
+        if idx is not None:
+            lo, hi = 0, self.num_statements
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._statements[mid * 4] < idx:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo < self.num_statements and self._statements[lo * 4] == idx:
+                return self._statement(lo)
+        raise KeyError(uuid_)
+
+    def find(self, s=None, p=None, o=None):
+        if s is None and p is None and o is None:
+            return [self._statement(row) for row in range(self.num_statements)]
+        given = {}
+        for column, value in ((1, s), (2, p), (3, o)):
+            if value is not None:
+                idx = self._value_index(value)
+                if idx is None:
+                    return []
+                given[column] = idx
+        for name, columns in ORDERS:
+            n = len(given)
+            if set(columns[:n]) == set(given):
+                return self._range(name, columns, tuple(given[c] for c in columns[:n]))
+
+    def get_files(self, blob):
+        idx = self._value_index(blob)
+        if idx is None:
+            return []
+        lo, hi = 0, len(self._file_blobs)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._file_blobs[mid] < idx:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == len(self._file_blobs) or self._file_blobs[lo] != idx:
+            return []
+        start, end = self._file_offsets[lo], self._file_offsets[lo + 1]
+        return [
+            self.repo.unique_deserialize(self._value(i))
+            for i in self._file_values[start:end]
+        ]
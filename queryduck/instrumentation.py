@@ -0,0 +1,187 @@
+"""Pluggable timers, counters and histograms for the hot paths of the client.
+
+By default a no-op Instrumentation is installed, which hot paths can skip
+entirely by checking its `enabled` attribute. Install a Recorder with
+`set_instrumentation` to collect metrics, and export them with
+`Recorder.prometheus_text` or a LoggingExporter.
+"""
+import bisect
+import logging
+import threading
+import time
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        pass
+
+
+null_timer = NullTimer()
+
+
+class Timer:
+    def __init__(self, instrumentation, name, labels):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        elapsed = time.perf_counter() - self.start
+        self.instrumentation.observe(self.name, elapsed, **self.labels)
+
+
+class Instrumentation:
+    """Instrumentation that doesn't record anything."""
+
+    enabled = False
+
+    def count(self, name, value=1, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return null_timer
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Recorder(Instrumentation):
+    """Instrumentation that keeps counters and histograms in memory."""
+
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def count(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(self.buckets)
+            self.histograms[key].observe(value)
+
+    def timer(self, name, **labels):
+        return Timer(self, name, labels)
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+    @staticmethod
+    def _escape(value):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        return value.replace("\n", "\\n")
+
+    @classmethod
+    def _format_labels(cls, labels, extra=()):
+        parts = [
+            '{}="{}"'.format(k, cls._escape(v))
+            for k, v in tuple(labels) + tuple(extra)
+        ]
+        return "{{{}}}".format(",".join(parts)) if parts else ""
+
+    def prometheus_text(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        typed = set()
+
+        def add_type(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append("# TYPE {} {}".format(name, kind))
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda i: i[0])
+            for (name, labels), value in counters:
+                add_type(name, "counter")
+                lines.append("{}{} {}".format(name, self._format_labels(labels), value))
+            for (name, labels), h in histograms:
+                add_type(name, "histogram")
+                cumulative = 0
+                for bound, count in zip(h.buckets + ("+Inf",), h.counts):
+                    cumulative += count
+                    label_str = self._format_labels(labels, [("le", bound)])
+                    lines.append("{}_bucket{} {}".format(name, label_str, cumulative))
+                label_str = self._format_labels(labels)
+                lines.append("{}_sum{} {}".format(name, label_str, h.sum))
+                lines.append("{}_count{} {}".format(name, label_str, h.count))
+        return "\n".join(lines) + "\n"
+
+
+class LoggingExporter:
+    """Write a summary of a Recorder's metrics to a logger."""
+
+    def __init__(self, recorder, logger=None, level=logging.INFO):
+        self.recorder = recorder
+        self.logger = logger if logger else logging.getLogger("queryduck.metrics")
+        self.level = level
+
+    def export(self):
+        with self.recorder.lock:
+            counters = sorted(self.recorder.counters.items())
+            histograms = sorted(self.recorder.histograms.items(), key=lambda i: i[0])
+            for (name, labels), value in counters:
+                self.logger.log(self.level, "%s%s %s", name, dict(labels), value)
+            for (name, labels), h in histograms:
+                mean = h.sum / h.count if h.count else 0.0
+                self.logger.log(
+                    self.level,
+                    "%s%s count=%d sum=%.6f mean=%.6f",
+                    name,
+                    dict(labels),
+                    h.count,
+                    h.sum,
+                    mean,
+                )
+
+
+_instrumentation = Instrumentation()
+
+
+def get_instrumentation():
+    return _instrumentation
+
+
+def set_instrumentation(instrumentation):
+    """Install an Instrumentation, or the no-op default if None is given."""
+    global _instrumentation
+    _instrumentation = instrumentation if instrumentation else Instrumentation()
@@ -25,6 +25,14 @@ class QueryDuck:
             self.repo = StatementRepository(self.conn)
         return self.repo
 
+    def get_replica(self, path, sync=True):
+        from .replica import StatementReplica
+
+        replica = StatementReplica(self.get_repo(), path)
+        if sync:
+            replica.sync()
+        return replica
+
     def get_bindings(self):
         if self.bindings is None:
             schemas = []
@@ -0,0 +1,211 @@
+import copy
+
+from .evaluator import value_key
+from .query import (
+    AfterTuple,
+    Equals,
+    InList,
+    JoinEntity,
+    Main,
+    Order,
+    Prefer,
+    QueryEntity,
+)
+
+
+def _operand_key(operand, owner=None):
+    if isinstance(operand, QueryEntity):
+        return ("self",) if operand is owner else ("alias", operand.key)
+    return value_key(operand)
+
+
+def _element_key(element, owner=None):
+    """Return a key under which equivalent query elements are equal."""
+    if isinstance(element, InList):
+        values = frozenset(_operand_key(v, owner) for v in element.rhs)
+        return (InList, _operand_key(element.lhs, owner), values)
+    key = (type(element),) + tuple(
+        _operand_key(o, owner) for o in element.get_operands()
+    )
+    if isinstance(element, (Order, Prefer)):
+        key += (element.vtype,)
+    elif isinstance(element, AfterTuple):
+        key += tuple(_operand_key(v) for v in element.values)
+    return key
+
+
+def _entities(element):
+    operands = element.get_operands()
+    if isinstance(element, InList):
+        operands = [element.lhs] + list(element.rhs)
+    return {o.key: o for o in operands if isinstance(o, QueryEntity)}
+
+
+class QueryOptimizer:
+    """Rewrite a QDQuery into an equivalent one that is cheaper to execute.
+
+    The following rewrites are applied:
+
+    - Identical elements are only kept once.
+    - `InList` elements lose duplicate values, become `Equals` if a single
+      value remains, and are dropped if an `Equals` on the same entity
+      already implies them. Several `InList` elements on one entity are
+      intersected into one.
+    - Join chains that are equivalent (same join type, target, predicates
+      and constraints on them and their child joins) are merged.
+    - Joins that nothing refers to are removed.
+
+    The query model has no disjunctions, so `Equals` elements on one entity
+    are never merged into an `InList`: they all have to hold.
+    """
+
+    def optimize(self, query):
+        elements = self._dedupe(query.elements)
+        elements = self._simplify_lists(elements)
+        elements = self._merge_joins(elements)
+        elements = self._remove_unused_joins(elements)
+
+        kept = {id(e) for e in elements}
+        optimized = copy.copy(query)
+        optimized.elements = elements
+        optimized.joins = {
+            k: v
+            for k, v in query.joins.items()
+            if isinstance(v, Main) or id(v) in kept
+        }
+        return optimized
+
+    def _dedupe(self, elements):
+        seen = set()
+        result = []
+        for e in elements:
+            key = ("join", id(e)) if isinstance(e, JoinEntity) else _element_key(e)
+            if key not in seen:
+                seen.add(key)
+                result.append(e)
+        return result
+
+    def _simplify_lists(self, elements):
+        equals = {}
+        lists = {}
+        for e in elements:
+            if isinstance(e, (Equals, InList)) and isinstance(e.lhs, QueryEntity):
+                if isinstance(e, Equals) and not isinstance(e.rhs, QueryEntity):
+                    equals.setdefault(e.lhs.key, []).append(e)
+                elif isinstance(e, InList) and not _entities(e).keys() - {e.lhs.key}:
+                    lists.setdefault(e.lhs.key, []).append(e)
+
+        replacements = {}
+        for key, in_lists in lists.items():
+            values = None
+            for l in in_lists:
+                l_values = {}
+                for v in l.rhs:
+                    l_values.setdefault(value_key(v), v)
+                if values is None:
+                    values = l_values
+                else:
+                    values = {k: v for k, v in values.items() if k in l_values}
+            if not values:
+                # Contradictory lists, leave them for the server to sort out.
+                continue
+            eq_keys = {value_key(e.rhs) for e in equals.get(key, [])}
+            if eq_keys and eq_keys <= values.keys():
+                new = None
+            elif len(values) == 1:
+                new = Equals(in_lists[0].lhs, list(values.values())[0])
+            else:
+                new = InList(in_lists[0].lhs, list(values.values()))
+            replacements[id(in_lists[0])] = new
+            for l in in_lists[1:]:
+                replacements[id(l)] = None
+
+        result = []
+        for e in elements:
+            if id(e) in replacements:
+                if replacements[id(e)] is not None:
+                    result.append(replacements[id(e)])
+            else:
+                result.append(e)
+        return result
+
+    def _analyze(self, elements):
+        """Find the elements and child joins that belong to each join.
+
+        Joins that share an element with another join are pinned: they can't
+        be merged, because the element ties them to each other.
+        """
+        owned = {}
+        children = {}
+        pinned = set()
+        for e in elements:
+            if isinstance(e, JoinEntity):
+                children.setdefault(e.target.key, []).append(e)
+                continue
+            entities = _entities(e)
+            if len(entities) == 1:
+                owned.setdefault(list(entities)[0], []).append(e)
+            else:
+                pinned.update(entities)
+        return owned, children, pinned
+
+    def _merge_joins(self, elements):
+        owned, children, pinned = self._analyze(elements)
+        structures = {}
+
+        def structure(join):
+            """Describe a join and everything that depends on it, except its target."""
+            if join.key not in structures:
+                structures[join.key] = (
+                    type(join),
+                    frozenset(value_key(p) for p in join.predicates),
+                    frozenset(_element_key(e, join) for e in owned.get(join.key, [])),
+                    frozenset(structure(c) for c in children.get(join.key, [])),
+                    join.key if join.key in pinned else None,
+                )
+            return structures[join.key]
+
+        kept = set()
+        dropped = set()
+        for e in elements:
+            if isinstance(e, JoinEntity):
+                if e.target.key in dropped:
+                    dropped.add(e.key)
+                    continue
+                key = (e.target.key, structure(e))
+                if key in kept:
+                    dropped.add(e.key)
+                else:
+                    kept.add(key)
+
+        return [
+            e
+            for e in elements
+            if not (isinstance(e, JoinEntity) and e.key in dropped)
+            and not _entities(e).keys() & dropped
+        ]
+
+    def _remove_unused_joins(self, elements):
+        while True:
+            used = set()
+            for e in elements:
+                if isinstance(e, JoinEntity):
+                    used.add(e.target.key)
+                else:
+                    used.update(_entities(e))
+            unused = {
+                e.key
+                for e in elements
+                if isinstance(e, JoinEntity) and e.key not in used
+            }
+            if not unused:
+                return elements
+            elements = [
+                e
+                for e in elements
+                if not (isinstance(e, JoinEntity) and e.key in unused)
+            ]
+
+
+def optimize_query(query):
+    return QueryOptimizer().optimize(query)
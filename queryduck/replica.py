@@ -0,0 +1,105 @@
+import sqlite3
+import threading
+
+from .collection import BaseCollection
+from .serialization import serialize
+
+
+class StatementReplica(BaseCollection):
+    """Persistent local copy of the server's statements, stored in SQLite.
+
+    The replica keeps the cursor of the last statement it received, so `sync`
+    only fetches statements that were added since. Statements are read back
+    through the regular BaseCollection interface, with their triples
+    deserialized on first access.
+
+    The replica can be used from several threads. They share one SQLite
+    connection, which is only used by one thread at a time.
+    """
+
+    def __init__(self, repo, path):
+        self.repo = repo
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db_lock = threading.Lock()
+        with self._db_lock:
+            self._create_tables()
+
+    def _create_tables(self):
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS statement (
+                handle TEXT PRIMARY KEY,
+                subject TEXT NOT NULL,
+                predicate TEXT NOT NULL,
+                object TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS statement_sp ON statement (subject, predicate);
+            CREATE INDEX IF NOT EXISTS statement_po ON statement (predicate, object);
+            CREATE INDEX IF NOT EXISTS statement_o ON statement (object);
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+
+    def get_cursor(self):
+        with self._db_lock:
+            row = self.db.execute(
+                "SELECT value FROM sync_state WHERE key = 'after'"
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def sync(self):
+        """Fetch all statements added since the last sync, return their number."""
+        count = 0
+        for ser_statements, after in self.repo.iter_statement_pages(
+            after=self.get_cursor()
+        ):
+            with self._db_lock, self.db:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO statement VALUES (?, ?, ?, ?)",
+                    ser_statements,
+                )
+                self.db.execute(
+                    "INSERT OR REPLACE INTO sync_state VALUES ('after', ?)", (after,)
+                )
+            count += len(ser_statements)
+        return count
+
+    def _statement_from_row(self, row):
+        statement = self.repo.unique_deserialize(row[0])
+        if not statement.complete:
+            statement.set_raw_triple(row[1:], self.repo.unique_deserialize)
+        return statement
+
+    def get(self, handle):
+        with self._db_lock:
+            row = self.db.execute(
+                "SELECT * FROM statement WHERE handle = ?", ("s:{}".format(handle),)
+            ).fetchone()
+        if row is None:
+            raise KeyError(handle)
+        return self._statement_from_row(row)
+
+    def find(self, s=None, p=None, o=None):
+        conditions = []
+        values = []
+        for column, value in (("subject", s), ("predicate", p), ("object", o)):
+            if value is not None:
+                conditions.append("{} = ?".format(column))
+                values.append(serialize(value))
+        sql = "SELECT * FROM statement"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        with self._db_lock:
+            rows = self.db.execute(sql, values).fetchall()
+        return [self._statement_from_row(row) for row in rows]
+
+    def get_files(self, blob):
+        return []
+
+    def close(self):
+        with self._db_lock:
+            self.db.close()
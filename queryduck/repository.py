@@ -1,16 +1,89 @@
+import copy
+import json
 import weakref
 
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
 from .schema import Bindings, SchemaProcessor
 from .types import CompoundValue, Statement, Blob
-from .query import QDQuery, QueryEntity, query_to_request_params
+from .optimizer import optimize_query
+from .query import (
+    AfterTuple,
+    Having,
+    InList,
+    Main,
+    Order,
+    QDQuery,
+    QueryEntity,
+    query_to_request_params,
+)
 from .collection import Collection
+from .concurrency import NullLock, ShardedLock, SingleFlight
+from .deadlines import bind_deadline, deadline
+from .decoding import decode_response_body
+from .streaming import JSONStreamParser
+from .instrumentation import get_instrumentation
 from .serialization import serialize, deserialize
 from .utility import transform_doc
 
 
 class StatementRepository:
-    def __init__(self, connection):
+
+    max_query_string_length = 6000
+    inlist_chunk_size = 500
+    max_parallel_requests = 4
+    decode_pool_threshold = 1024 * 1024
+
+    def __init__(
+        self,
+        connection,
+        lazy=False,
+        optimize_queries=False,
+        coalesce_queries=None,
+        thread_safe=False,
+        decode_pool=None,
+        stream_responses=False,
+    ):
+        """Create a repository on top of a Connection.
+
+        If `lazy` is true, the triples of Statements in query results are kept
+        in serialized form until they are first accessed. If
+        `optimize_queries` is true, queries are rewritten by QueryOptimizer
+        before they are sent.
+
+        If `thread_safe` is true, the repository can be shared by several
+        threads: the Statement and Blob identity maps are guarded by sharded
+        locks, so every handle maps to exactly one instance even when it is
+        deserialized concurrently. If `coalesce_queries` is true, identical
+        queries executed concurrently from several threads share one request
+        and the resulting Collection. As that Collection is then used by
+        several threads, this requires `thread_safe`, and is enabled along
+        with it by default.
+
+        If a `decode_pool` (e.g. a ProcessPoolExecutor) is given, query
+        responses of at least `decode_pool_threshold` bytes are parsed in it,
+        and only their distinct values are deserialized in this process.
+        Otherwise, if `stream_responses` is true, query responses are parsed
+        incrementally while they are being received, and every statement is
+        deserialized as soon as it has arrived.
+        """
+        if coalesce_queries is None:
+            coalesce_queries = thread_safe
+        elif coalesce_queries and not thread_safe:
+            raise ValueError("coalesce_queries requires thread_safe")
         self.connection = connection
+        self.lazy = lazy
+        self.optimize_queries = optimize_queries
+        self.coalesce_queries = coalesce_queries
+        self.singleflight = SingleFlight()
+        self.thread_safe = thread_safe
+        self._lock_for = NullLock()
+        if thread_safe:
+            self._lock_for = ShardedLock()
+            self._unique = self._unique_locked
+        self.decode_pool = decode_pool
+        self.stream_responses = stream_responses
         self.statement_map = weakref.WeakValueDictionary()
         self.blob_map = weakref.WeakValueDictionary()
 
@@ -21,25 +94,65 @@ class StatementRepository:
     def import_statements(self, ser_statements):
         self.connection.create_statements(ser_statements)
 
+    def iter_statement_pages(self, after=None):
+        """Yield all pages of serialized statements with the cursor after each."""
+        while True:
+            ser_statements = self.export_statements(after=after)
+            if not ser_statements:
+                break
+            after = ser_statements[-1][0]
+            yield ser_statements, after
+
+    def export_to_file(self, path, resume=True):
+        from .export import StatementExporter
+
+        exporter = StatementExporter(self, path)
+        return exporter.export(resume=resume)
+
+    def import_from_file(self, path, chunk_size=1000, parallelism=4):
+        from .export import StatementImporter
+
+        importer = StatementImporter(self, path, chunk_size, parallelism)
+        return importer.run()
+
     def unique_deserialize(self, ref):
         """Ensures there is only ever one instance of the same Statement present"""
         s = deserialize(ref)
+        instr = get_instrumentation()
+        if instr.enabled:
+            instr.count("queryduck_deserialize_total", vtype=type(s).__name__)
         if type(s) == Statement:
-            if s.handle not in self.statement_map:
-                self.statement_map[s.handle] = s
-            return self.statement_map[s.handle]
+            return self._unique(self.statement_map, s)
         elif type(s) == Blob:
-            if s.handle not in self.blob_map:
-                self.blob_map[s.handle] = s
-            return self.blob_map[s.handle]
+            return self._unique(self.blob_map, s)
         else:
             return s
 
+    def _unique(self, value_map, value):
+        existing = value_map.get(value.handle)
+        if existing is None:
+            value_map[value.handle] = value
+            existing = value
+        return existing
+
+    def _unique_locked(self, value_map, value):
+        with self._lock_for(value.handle):
+            existing = value_map.get(value.handle)
+            if existing is None:
+                value_map[value.handle] = value
+                existing = value
+        return existing
+
     def bindings_from_schemas(self, schemas):
-        bindings_content = {}
+        ser_bindings = {}
         for schema in schemas:
-            for k, v in schema["bindings"].items():
-                bindings_content[k] = self.unique_deserialize(v)
+            ser_bindings.update(schema["bindings"])
+        return self.bindings_from_content(ser_bindings)
+
+    def bindings_from_content(self, ser_bindings):
+        bindings_content = {
+            k: self.unique_deserialize(v) for k, v in ser_bindings.items()
+        }
         bindings = Bindings(bindings_content)
         return bindings
 
@@ -63,17 +176,176 @@ class StatementRepository:
         result = self._result_from_response(response)
         return result
 
-    def execute(self, query, serializer=None, post_query=False):
+    def execute(self, query, serializer=None, post_query=False, timeout=None):
+        """Execute a query, return its results and a Collection of its statements.
+
+        If `timeout` is given, the query fails with DeadlineExceeded if it
+        doesn't complete within that many seconds.
+        """
+        with deadline(timeout):
+            return self._execute(query, serializer, post_query)
+
+    def _execute(self, query, serializer, post_query):
         if serializer is None:
             serializer = serialize
         target = "blob" if query.target == Blob else "statement"
+        if self.optimize_queries:
+            query = optimize_query(query)
         params = query_to_request_params(query, serializer)
+        instr = get_instrumentation()
+
+        def run():
+            with instr.timer("queryduck_execute_seconds", target=target):
+                if not post_query and self._query_string_too_long(params):
+                    inlist = self._chunkable_inlist(query)
+                    if inlist is None:
+                        return self._execute_params(params, target, True)
+                    return self._execute_chunked(query, inlist, serializer, target)
+                return self._execute_params(params, target, post_query)
+
+        if not self.coalesce_queries:
+            return run()
+        key = (target, post_query, query.limit, tuple(params))
+        results, coll = self.singleflight.do(key, run)
+        return list(results), coll
+
+    def _execute_params(self, params, target, post_query):
+        if self.decode_pool is not None:
+            return self._execute_params_pooled(params, target, post_query)
+        if self.stream_responses:
+            return self._execute_params_streamed(params, target, post_query)
+        response = self._fetch_query(params, target, post_query)
+        with get_instrumentation().timer(
+            "queryduck_result_decode_seconds", target=target
+        ):
+            return self._result_from_response(response)
+
+    def _execute_params_pooled(self, params, target, post_query):
+        body = self._fetch_query(params, target, post_query, raw=True)
+        with get_instrumentation().timer(
+            "queryduck_result_decode_seconds", target=target
+        ):
+            if len(body) < self.decode_pool_threshold:
+                return self._result_from_response(json.loads(body))
+            interned = self.decode_pool.submit(decode_response_body, body).result()
+            return self._result_from_interned(interned)
+
+    def _execute_params_streamed(self, params, target, post_query):
+        chunks = self._fetch_query(params, target, post_query, stream=True)
+        with get_instrumentation().timer(
+            "queryduck_result_decode_seconds", target=target
+        ):
+            return self._result_from_stream(chunks)
+
+    def _fetch_query(self, params, target, post_query, raw=False, stream=False):
         if post_query:
-            response = self.connection.post_query(params, target=target)
+            return self.connection.post_query(
+                params, target=target, raw=raw, stream=stream
+            )
         else:
-            response = self.connection.get_query(params, target=target)
-        result = self._result_from_response(response)
-        return result
+            return self.connection.get_query(
+                params, target=target, raw=raw, stream=stream
+            )
+
+    def _query_string_too_long(self, params):
+        return len(urlencode(params)) > self.max_query_string_length
+
+    def _chunkable_inlist(self, query):
+        """Find the largest InList that the query can be split on, if any.
+
+        Queries with an Order or AfterTuple are never split, because their
+        results can't be merged without the values they are sorted on, and
+        neither are queries with a Having, because every chunk would count
+        only part of the values.
+        """
+        inlists = []
+        for e in query.elements:
+            if isinstance(e, (Order, AfterTuple, Having)):
+                return None
+            elif isinstance(e, InList) and len(e.rhs) > self.inlist_chunk_size:
+                inlists.append(e)
+        return max(inlists, key=lambda e: len(e.rhs), default=None)
+
+    def _execute_chunked(self, query, inlist, serializer, target):
+        """Execute a query once per chunk of a large InList and merge the results.
+
+        The merged results are ordered by handle, and cut off at the limit of
+        the query.
+        """
+        chunk_params = []
+        for i in range(0, len(inlist.rhs), self.inlist_chunk_size):
+            chunk = InList(inlist.lhs, inlist.rhs[i : i + self.inlist_chunk_size])
+            q = copy.copy(query)
+            q.elements = [chunk if e is inlist else e for e in query.elements]
+            chunk_params.append(query_to_request_params(q, serializer))
+
+        @bind_deadline
+        def fetch(params):
+            post_query = self._query_string_too_long(params)
+            return self._fetch_query(params, target, post_query)
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel_requests) as executor:
+            responses = list(executor.map(fetch, chunk_params))
+
+        results = []
+        seen = set()
+        coll = Collection()
+        for response in responses:
+            chunk_results, chunk_coll = self._result_from_response(response)
+            for r in chunk_results:
+                if id(r) not in seen:
+                    seen.add(id(r))
+                    results.append(r)
+            coll.add_statements(chunk_coll.statements)
+            coll.add_files(chunk_coll.files)
+
+        # Sort on the client, so the merged order and the results that are
+        # cut off don't depend on the order of the chunks, nor on the order a
+        # server returns the results of a chunk in.
+        results.sort(key=lambda r: r.handle)
+        if len(results) <= query.limit:
+            return results, coll
+
+        # The chunks also fetched statements for the results that are cut, so
+        # fetch the statements of the remaining ones again in one request.
+        kept = InList(Main(query.target), results[: query.limit])
+        q = copy.copy(query)
+        if inlist.lhs.key == "main":
+            q.elements = [kept if e is inlist else e for e in query.elements]
+        else:
+            q.elements = query.elements + [kept]
+        params = query_to_request_params(q, serializer)
+        response = self._fetch_query(params, target, True)
+        results, coll = self._result_from_response(response)
+        return sorted(results, key=lambda r: r.handle), coll
+
+    def execute_batch(self, queries, serializer=None, timeout=None):
+        """Execute several queries with as few requests as possible.
+
+        Returns a `(results, Collection)` tuple for every query, in order.
+        """
+        with deadline(timeout):
+            return self._execute_batch(queries, serializer)
+
+    def _execute_batch(self, queries, serializer):
+        if serializer is None:
+            serializer = serialize
+        by_target = {}
+        for idx, query in enumerate(queries):
+            target = "blob" if query.target == Blob else "statement"
+            if self.optimize_queries:
+                query = optimize_query(query)
+            params = query_to_request_params(query, serializer)
+            by_target.setdefault(target, []).append((idx, params))
+
+        results = [None] * len(queries)
+        for target, entries in by_target.items():
+            responses = self.connection.batch_query(
+                [params for idx, params in entries], target=target
+            )
+            for (idx, params), response in zip(entries, responses):
+                results[idx] = self._result_from_response(response)
+        return results
 
     def legacy_query(self, query=None, target="statement", after=None):
         filters = [c.api_value() for c in comparisons]
@@ -92,19 +364,74 @@ class StatementRepository:
         result = self._result_from_response(response)
         return result
 
-    def _statement_result_from_response(self, ser_statements):
-        statements = {}
-        for k, v in ser_statements.items():
-            statement = self.unique_deserialize(k)
-            if statement.triple is None:
+    def _statement_from_response(self, k, v):
+        statement = self.unique_deserialize(k)
+        if not statement.complete:
+            if self.lazy:
+                statement.set_raw_triple(v, self.unique_deserialize)
+            else:
                 statement.triple = (
                     self.unique_deserialize(v[0]),
                     self.unique_deserialize(v[1]),
                     self.unique_deserialize(v[2]),
                 )
+        return statement
+
+    def _statement_result_from_response(self, ser_statements):
+        statements = {}
+        for k, v in ser_statements.items():
+            statement = self._statement_from_response(k, v)
             statements[statement.handle] = statement
         return statements
 
+    def _result_from_stream(self, chunks):
+        """Build a query result from a response streamed as text chunks."""
+        statements = {}
+        results = []
+        files = {}
+        parser = JSONStreamParser(chunks)
+        for section, item in parser.sections(("statements", "references", "files")):
+            if section == "statements":
+                statement = self._statement_from_response(*item)
+                statements[statement.handle] = statement
+            elif section == "references":
+                results.append(self.unique_deserialize(item))
+            elif section == "files":
+                blob = self.unique_deserialize(item[0])
+                files[blob] = [self.unique_deserialize(f) for f in item[1]]
+        coll = Collection(statements=statements, files=files)
+        return results, coll
+
+    def _result_from_interned(self, interned):
+        """Rebuild a query result from an InternedResponse."""
+        values = interned.values
+        objects = [None] * len(values)
+
+        def get(i):
+            o = objects[i]
+            if o is None:
+                o = objects[i] = self.unique_deserialize(values[i])
+            return o
+
+        statements = {}
+        arr = interned.statements
+        for i in range(0, len(arr), 4):
+            statement = get(arr[i])
+            if not statement.complete:
+                if self.lazy:
+                    statement.set_raw_triple(
+                        [values[j] for j in arr[i + 1 : i + 4]],
+                        self.unique_deserialize,
+                    )
+                else:
+                    statement.triple = tuple(get(j) for j in arr[i + 1 : i + 4])
+            statements[statement.handle] = statement
+
+        results = [get(i) for i in interned.references]
+        files = {get(k): [get(f) for f in v] for k, v in interned.files}
+        coll = Collection(statements=statements, files=files)
+        return results, coll
+
     def _result_from_response(self, response):
         statements = self._statement_result_from_response(response["statements"])
         results = [self.unique_deserialize(r) for r in response["references"]]
@@ -116,7 +443,6 @@ class StatementRepository:
                 files[blob] = [self.unique_deserialize(f) for f in v]
 
         coll = Collection(statements=statements, files=files)
-        coll.index()
         return results, coll
 
     def create(self, rows):
@@ -147,16 +473,20 @@ class StatementRepository:
             statement.id = None
             # TODO: This sets the map entry unconditionally. The handle *should* be new,
             # but it's better to not assume this, and add some kind of sanity check.
-            self.statement_map[statement.handle] = statement
+            with self._lock_for(statement.handle):
+                self.statement_map[statement.handle] = statement
         return statements
 
 
-    def submit(self, transaction):
+    def submit(self, transaction, timeout=None):
         if len(transaction.statements) == 0:
             return Collection()
-        ser_statements = self.serialize_transaction(transaction)
-        ser_result = self.connection.submit_transaction(ser_statements)
-        results = self._process_transaction_result(ser_result["references"], transaction.statements)
-        statements = self._statement_result_from_response(ser_result["statements"])
-        coll = Collection(statements=statements)
+        with deadline(timeout), get_instrumentation().timer(
+            "queryduck_submit_seconds"
+        ):
+            ser_statements = self.serialize_transaction(transaction)
+            ser_result = self.connection.submit_transaction(ser_statements)
+            results = self._process_transaction_result(ser_result["references"], transaction.statements)
+            statements = self._statement_result_from_response(ser_result["statements"])
+            coll = Collection(statements=statements)
         return coll
@@ -6,6 +6,8 @@ from functools import partial
 from datetime import datetime as dt
 from pathlib import Path
 
+from .exceptions import UserError
+from .instrumentation import get_instrumentation
 from .types import File
 
 from .utility import (
@@ -18,39 +20,149 @@ class StorageHelper():
     def __init__(self, context, config):
         self.context = context
         self.config = config
+        self.volume_paths = {
+            k: Path(v["path"]) for k, v in config["volumes"].items()
+        }
 
     def path_from_file(self, file_):
-        for volume_reference, volume_options in self.config["volumes"].items():
-            if volume_reference == file_.volume:
-                p = Path(volume_options["path"])
-                return p / Path(os.fsdecode(file_.path))
-        return None
-
+        volume_path = self.volume_paths.get(file_.volume)
+        if volume_path is None:
+            return None
+        return volume_path / Path(os.fsdecode(file_.path))
+
+    def paths_from_files(self, files):
+        return [self.path_from_file(f) for f in files]
+
+
+class VolumeTrie:
+    """Map paths to the volumes containing them, using a trie of path parts.
+
+    Each node is a dict of child parts, with the reference of the volume
+    rooted there under the None key. Lookups take one step per path part,
+    however many volumes there are. If volumes are nested, the innermost one
+    wins.
+    """
+
+    def __init__(self, volumes):
+        self.root = {}
+        for volume_reference, volume_path in volumes.items():
+            node = self.root
+            for part in volume_path.parts:
+                node = node.setdefault(part, {})
+            node[None] = (volume_reference, len(volume_path.parts))
+
+    def lookup(self, parts):
+        """Return (volume reference, number of volume path parts), or None.
+
+        Only volumes that strictly contain the path match.
+        """
+        node = self.root
+        match = None
+        for part in parts[:-1]:
+            node = node.get(part)
+            if node is None:
+                break
+            match = node.get(None, match)
+        return match
 
 
 class VolumeFileAnalyzer:
     def __init__(self, volume_config):
         self.volumes = {k: Path(v["path"]) for k, v in volume_config.items()}
+        self.trie = VolumeTrie(self.volumes)
+        # Directory -> (volume reference, path prefix within the volume)
+        self.directories = {}
+
+    def _resolve_directory(self, directory):
+        try:
+            return self.directories[directory]
+        except KeyError:
+            pass
+        parts = Path(directory).parts
+        match = self.trie.lookup(parts + ("",))
+        if match is not None:
+            volume_reference, depth = match
+            prefix = b"".join(os.fsencode(p) + b"/" for p in parts[depth:])
+            match = (volume_reference, prefix)
+        self.directories[directory] = match
+        return match
 
     def analyze(self, path):
         if path.is_dir():
-            raise UserError("Cannot process directory: {}".format(real))
-        for volume_reference, volume_path in self.volumes.items():
-            if volume_path in path.parents:
-                subpath = path.relative_to(volume_path)
-                file_ = File(volume=volume_reference, path=bytes(subpath))
-                break
-        else:
+            raise UserError("Cannot process directory: {}".format(path))
+        directory, name = os.path.split(path)
+        match = self._resolve_directory(directory)
+        if match is None:
             raise UserError("No volume found for {}".format(path))
-        return file_
+        volume_reference, prefix = match
+        return File(volume=volume_reference, path=prefix + os.fsencode(name))
+
+    def analyze_many(self, paths):
+        """Analyze a sequence of paths, return a list of Files."""
+        return [self.analyze(path) for path in paths]
+
+    def find_files(self, conn, paths):
+        """Look up the server's file records for local paths.
+
+        Returns a dict of path to file record, for the paths the server knows.
+        """
+        by_volume = {}
+        for path, file_ in zip(paths, self.analyze_many(paths)):
+            by_volume.setdefault(file_.volume, {})[os.fsdecode(file_.path)] = path
+        found = {}
+        for volume_reference, volume_paths in by_volume.items():
+            records = conn.find_files(volume_reference, list(volume_paths))
+            for subpath, record in records.items():
+                found[volume_paths[subpath]] = record
+        return found
 
 
 class VolumeProcessor:
-    def __init__(self, conn, reference, path=None, exclude=None):
+    """Bring the server's file records of a volume up to date with its tree.
+
+    File records include the device and inode of the file, so files that
+    were moved or renamed within the volume keep the handle of their old
+    record, and hardlinked copies share the handle of the first one seen,
+    instead of being hashed again. New and changed files are only processed
+    after the whole tree has been compared, so every deleted record is known
+    by then.
+
+    This needs a server that stores the `device` and `inode` fields of file
+    records. Records from before they were tracked only get them added once
+    the server has returned them in some record, or from the start if
+    `backfill_inodes` is true. Otherwise every unchanged record would be
+    sent again on every scan by servers that drop the fields.
+    """
+
+    def __init__(self, conn, reference, path=None, exclude=None, backfill_inodes=False):
         self.conn = conn
         self.reference = reference
         self.root = Path(path)
         self.exclude = exclude
+        self.backfill_inodes = backfill_inodes
+        # Inode key -> file record, for records whose handle can be reused
+        self.known = {}
+        self.pending = []
+
+    @staticmethod
+    def _inode_key(st):
+        return (
+            st.st_dev,
+            st.st_ino,
+            st.st_size,
+            dt.utcfromtimestamp(st.st_mtime),
+        )
+
+    @staticmethod
+    def _record_key(record):
+        if record.get("inode") is None:
+            return None
+        return (
+            record["device"],
+            record["inode"],
+            record["size"],
+            dt.fromisoformat(record["mtime"]),
+        )
 
     def update(self):
         tfi = TreeFileIterator(self.root, self.exclude)
@@ -58,48 +170,92 @@ class VolumeProcessor:
         ci = CombinedIterator(
             tfi, afi, lambda x: str(x.relative_to(tfi.root)), lambda x: x["path"]
         )
-        with FileUpdater(self.conn, self.reference) as updater:
-            for local, remote in ci:
-                k, v = self._update_file_status(local, remote)
-                if k:
-                    updater.add(k, v)
+        self.known = {}
+        self.pending = []
+        with get_instrumentation().timer("queryduck_volume_update_seconds"):
+            with FileUpdater(self.conn, self.reference) as updater:
+                for local, remote in ci:
+                    k, v = self._update_file_status(local, remote)
+                    if k:
+                        updater.add(k, v)
+                for relpath, local in self.pending:
+                    updater.add(relpath, self._process_file(local))
+        self.known = {}
+        self.pending = []
 
     def _update_file_status(self, local, remote):
+        instr = get_instrumentation()
+        if remote is not None and remote.get("inode") is not None:
+            self.backfill_inodes = True
         if local is None:
+            instr.count("queryduck_volume_files_total", status="deleted")
             print("DELETED", safe_string(remote["path"]))
+            key = self._record_key(remote)
+            if key is not None:
+                self.known.setdefault(key, remote)
             return remote["path"], None
-        elif (
+        st = local.stat()
+        if (
             remote is None
-            or local.stat().st_size != remote["size"]
-            or dt.utcfromtimestamp(local.stat().st_mtime)
-            != dt.fromisoformat(remote["mtime"])
+            or st.st_size != remote["size"]
+            or dt.utcfromtimestamp(st.st_mtime) != dt.fromisoformat(remote["mtime"])
         ):
             relpath = str(local.relative_to(self.root))
+            instr.count(
+                "queryduck_volume_files_total",
+                status="new" if remote is None else "changed",
+            )
             print(
                 "NEW" if remote is None else "CHANGED",
                 relpath.encode("utf-8", errors="replace"),
             )
-            return relpath, self._process_file(local)
+            self.pending.append((relpath, local))
+            return None, None
         else:
+            instr.count("queryduck_volume_files_total", status="unchanged")
+            if st.st_nlink > 1:
+                self.known.setdefault(self._inode_key(st), remote)
+            if self.backfill_inodes and self._record_key(remote) is None:
+                # Record from before inodes were tracked
+                remote = dict(remote, device=st.st_dev, inode=st.st_ino)
+                return str(local.relative_to(self.root)), remote
             return None, remote
 
     def _get_file_handle(self, path):
+        instr = get_instrumentation()
         s = hashlib.sha256()
-        with path.open("rb") as f:
-            for chunk in iter(partial(f.read, 256 * 1024), b""):
-                s.update(chunk)
+        with instr.timer("queryduck_volume_hash_seconds"):
+            with path.open("rb") as f:
+                for chunk in iter(partial(f.read, 256 * 1024), b""):
+                    s.update(chunk)
+                    if instr.enabled:
+                        instr.count("queryduck_volume_hashed_bytes_total", len(chunk))
         return s.digest()
 
     def _process_file(self, path):
         try:
-            file_info = {
-                "mtime": dt.utcfromtimestamp(path.stat().st_mtime).isoformat(),
-                "size": path.stat().st_size,
-                "lastverify": dt.now().isoformat(),
-                "handle": urlsafe_b64encode(self._get_file_handle(path)).decode(
+            st = path.stat()
+            key = self._inode_key(st)
+            known = self.known.get(key)
+            if known is not None:
+                get_instrumentation().count("queryduck_volume_reused_handles_total")
+                lastverify = known["lastverify"]
+                handle = known["handle"]
+            else:
+                lastverify = dt.now().isoformat()
+                handle = urlsafe_b64encode(self._get_file_handle(path)).decode(
                     "utf-8"
-                ),
+                )
+            file_info = {
+                "mtime": key[3].isoformat(),
+                "size": st.st_size,
+                "lastverify": lastverify,
+                "handle": handle,
+                "device": st.st_dev,
+                "inode": st.st_ino,
             }
+            if st.st_nlink > 1:
+                self.known.setdefault(key, file_info)
         except PermissionError:
             print("Permission error, ignoring:", path)
             file_info = None
@@ -134,7 +290,8 @@ class FileUpdater(object):
     def flush(self):
         if len(self.batch):
             print("[{},{}] Send file batch...", end="")
-            self.conn.mutate_files(self.reference, self.batch)
+            with get_instrumentation().timer("queryduck_volume_flush_seconds"):
+                self.conn.mutate_files(self.reference, self.batch)
             print(" done.")
             self.batch = {}
 
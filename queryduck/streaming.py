@@ -0,0 +1,111 @@
+"""Incremental parsing of JSON responses.
+
+Query responses are JSON objects whose sections can be very large. Instead of
+loading the complete body and building the complete dict before anything is
+deserialized, the sections are parsed from the stream of text chunks one
+member at a time, so the caller can process every member as soon as it has
+arrived and the serialized form never has to be held in memory completely.
+"""
+import json
+
+from .exceptions import QDValueError
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\n\r"
+
+
+class JSONStreamParser:
+    """Parse a JSON object from an iterable of text chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        for chunk in self.chunks:
+            if chunk:
+                self.buf = self.buf[self.pos:] + chunk
+                self.pos = 0
+                return True
+        self.eof = True
+        return False
+
+    def _peek(self):
+        """Return the next non-whitespace character, or '' at the end."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _whitespace:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        c = self._peek()
+        if c == "" or c not in chars:
+            raise QDValueError(
+                "Expected one of {!r}, found {!r}".format(chars, c or "end of input")
+            )
+        self.pos += 1
+        return c
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if self.eof or not self._fill():
+                    raise QDValueError(str(e))
+                continue
+            # A number at the end of the buffer may continue in the next chunk.
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _members(self):
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            if type(key) != str:
+                raise QDValueError("Object keys must be strings")
+            self._expect(":")
+            yield key
+            if self._expect(",}") == "}":
+                return
+
+    def _elements(self):
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self._expect(",]") == "]":
+                return
+
+    def sections(self, streamed=()):
+        """Yield a (section, item) pair for the top-level object.
+
+        Sections named in `streamed` are not parsed at once: an object yields
+        every (key, value) member as an item, and an array every element.
+        Other sections are yielded as a single item with their complete value.
+        """
+        for section in self._members():
+            c = self._peek()
+            if section in streamed and c == "{":
+                for key in self._members():
+                    yield section, (key, self._value())
+            elif section in streamed and c == "[":
+                for _ in self._elements():
+                    yield section, self._value()
+            else:
+                yield section, self._value()
+        if self._peek() != "":
+            raise QDValueError("Unexpected data after the JSON object")
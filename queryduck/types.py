@@ -21,16 +21,39 @@ class Statement(CompoundValue):
     def __init__(self, handle=None, id_=None, triple=None):
         self.handle = uuid.UUID(handle) if type(handle) == str else handle
         self.id = id_
-        self.triple = triple
+        self._triple = triple
+        self._raw_triple = None
         self.saved = False
 
+    @property
+    def triple(self):
+        raw = self._raw_triple
+        if raw is not None:
+            ser_triple, deserializer = raw
+            self._triple = tuple(deserializer(v) for v in ser_triple)
+            self._raw_triple = None
+        return self._triple
+
+    @triple.setter
+    def triple(self, triple):
+        self._triple = triple
+        self._raw_triple = None
+
+    def set_raw_triple(self, ser_triple, deserializer):
+        """Store a serialized triple, to be deserialized on first access."""
+        self._raw_triple = (ser_triple, deserializer)
+
+    @property
+    def complete(self):
+        return self._triple is not None or self._raw_triple is not None
+
     def __repr__(self):
         parts = [
             "{}={}".format(k, getattr(self, k))
             for k in ("handle", "id")
             if getattr(self, k) is not None
         ]
-        if self.triple:
+        if self.complete:
             parts.append("complete")
         return "<Statement {}>".format(" ".join(parts))
 
@@ -1,3 +1,4 @@
+from .collection import Collection, GroupedCollection
 from .serialization import serialize, make_identifier
 
 
@@ -39,19 +40,35 @@ def transform_doc(doc, transform):
 
 
 class DocProcessor:
-    def __init__(self, coll, bindings):
+    def __init__(self, coll, bindings, expander=None, max_depth=10):
         self.coll = coll
         self.bindings = bindings
+        self.expander = expander
+        self.max_depth = max_depth
 
-    def value_to_doc(self, value):
+    def value_to_doc(self, value, expand_depth=None):
+        """Describe a value and its surroundings as a nested document.
+
+        If an expander is available and `expand_depth` is given, the
+        neighborhood of the value is fetched first, up to that many hops, and
+        the statements that aren't in the collection yet are added to it.
+        """
         b = self.bindings
+        coll = self.coll
+        if self.expander is not None and expand_depth:
+            expanded = self.expander.expand([value], expand_depth, b.reverse_exists)
+            new = {
+                handle: st
+                for handle, st in expanded.statements.items()
+                if all(known.handle != handle for known in coll.find(*st.triple))
+            }
+            coll = GroupedCollection([self.coll, Collection(statements=new)])
         main_parent = {"main": {}}
         stack = [(value, main_parent, "main", 0, (value,))]
         i = 0
         while stack:
             v, parent, key, depth, parents = stack.pop()
-            #print("PARENTSET", parentset)
-            if depth > 10:
+            if depth > self.max_depth:
                 continue
             if (b.reverse_exists(v) and depth >= 1) or not hasattr(v, "handle"):
                 val = b.reverse(v) if b.reverse_exists(v) else serialize(v)
@@ -68,7 +85,7 @@ class DocProcessor:
                 else:
                     sub["="] = serialize(v)
 
-                labels = self.coll.objects_for(v, b.label)
+                labels = coll.objects_for(v, b.label)
                 for l in labels:
                     if type(l) == str:
                         label = l
@@ -77,7 +94,7 @@ class DocProcessor:
                     label = None
                     #break
 
-                types = self.coll.objects_for(v, b.type)
+                types = coll.objects_for(v, b.type)
                 rlabel = False
                 if b.Resource in types:
                     otypes = [t for t in types if t != b.Resource]
@@ -86,8 +103,8 @@ class DocProcessor:
                         sub["/"] = "/".join([""] + btypes + [label])
                         rlabel = True
 
-                object_statements = [s for s in self.coll.find(s=v) if s != s.triple[2]]
-                subject_statements = [s for s in self.coll.find(o=v) if s != s.triple[0]]
+                object_statements = [s for s in coll.find(s=v) if s != s.triple[2]]
+                subject_statements = [s for s in coll.find(o=v) if s != s.triple[0]]
                 for s in object_statements:
                     if s.triple[2] in parents or (rlabel and s.triple[1] in (b.type, b.label)):
                         continue
@@ -0,0 +1,28 @@
+from benchmarks.server import FakeServer
+from benchmarks.synthetic import SyntheticGraph
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def graph():
+    """A graph with more resources than fit in a single InList chunk."""
+    return SyntheticGraph(size=1500, fanout=2, seed=1)
+
+
+@pytest.fixture(scope="session")
+def server(graph):
+    with FakeServer(graph.statements) as server:
+        yield server
+
+
+@pytest.fixture(scope="session")
+def small_graph():
+    """A graph whose statements are all returned by a single query."""
+    return SyntheticGraph(size=50, fanout=2, seed=3)
+
+
+@pytest.fixture(scope="session")
+def small_server(small_graph):
+    with FakeServer(small_graph.statements) as server:
+        yield server
@@ -0,0 +1,53 @@
+from benchmarks.server import FakeServer
+from queryduck.connection import Connection
+from queryduck.query import Main, QDQuery
+from queryduck.repository import StatementRepository
+from queryduck.types import Statement
+
+
+def make_queries(repo, graph):
+    b = repo.bindings_from_content(graph.bindings)
+    queries = []
+    for t in graph.types[:3]:
+        m = Main(Statement)
+        queries.append(
+            QDQuery(Statement).add(
+                m.object_for(b.type) == repo.unique_deserialize(t),
+                m.object_for(b.label).fetch(),
+            )
+        )
+    return queries
+
+
+def summary(results, coll):
+    return [r.handle for r in results], sorted(coll.statements)
+
+
+def check_batch(server, graph):
+    repo = StatementRepository(Connection(server.url, "user", "password"))
+    queries = make_queries(repo, graph)
+    expected = [summary(*repo.execute(q, post_query=True)) for q in queries]
+    assert all(results for results, statements in expected)
+
+    requests = server.requests
+    batch = repo.execute_batch(queries)
+    assert [summary(*r) for r in batch] == expected
+    return repo, server.requests - requests
+
+
+def test_batch(small_server, small_graph):
+    repo, requests = check_batch(small_server, small_graph)
+    assert requests == 1
+    assert repo.connection.batch_supported is True
+
+
+def test_batch_unsupported(small_graph):
+    with FakeServer(small_graph.statements, batch=False) as server:
+        repo, requests = check_batch(server, small_graph)
+        # The rejected batch, and one request per query
+        assert requests == 4
+        assert repo.connection.batch_supported is False
+
+        requests = server.requests
+        repo.execute_batch(make_queries(repo, small_graph))
+        assert server.requests - requests == 3
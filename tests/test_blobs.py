@@ -0,0 +1,104 @@
+import hashlib
+import os
+
+from queryduck.blobs import BlobTransfer, LocalBlobStore, VolumeBlobSource
+from queryduck.collection import Collection
+from queryduck.exceptions import QDValueError
+from queryduck.storage import StorageHelper
+from queryduck.types import Blob, File
+
+import pytest
+
+
+def make_blob(content):
+    return Blob(handle=hashlib.sha256(content).digest())
+
+
+def store_content(store, content):
+    blob = make_blob(content)
+    writer = store.writer(blob)
+    writer.write(content)
+    writer.commit()
+    return blob
+
+
+def stored(store, blob):
+    return b"".join(bytes(c) for c in store.read(blob))
+
+
+@pytest.fixture
+def contents():
+    return [os.urandom(n) for n in (0, 10, 1000, 5000)]
+
+
+def test_transfer(tmp_path, contents):
+    source = LocalBlobStore(tmp_path / "source", chunk_size=256)
+    target = LocalBlobStore(tmp_path / "target", chunk_size=256)
+    blobs = [store_content(source, c) for c in contents]
+    transfer = BlobTransfer(source, target)
+    assert transfer.transfer(blobs + blobs[:1]) == 4
+    assert [stored(target, b) for b in blobs] == contents
+    assert transfer.transfer(blobs) == 0
+
+
+class FailingStore(LocalBlobStore):
+    """Store whose reads fail after a number of chunks."""
+
+    def __init__(self, root, fail_after, **kwargs):
+        super().__init__(root, **kwargs)
+        self.fail_after = fail_after
+        self.offsets = []
+
+    def read(self, blob, offset=0):
+        self.offsets.append(offset)
+        for i, chunk in enumerate(super().read(blob, offset)):
+            if i == self.fail_after:
+                raise ConnectionError()
+            yield chunk
+
+
+def test_resume(tmp_path):
+    content = os.urandom(1000)
+    source = FailingStore(tmp_path / "source", fail_after=2, chunk_size=256)
+    target = LocalBlobStore(tmp_path / "target")
+    blob = store_content(source, content)
+    with pytest.raises(ConnectionError):
+        BlobTransfer(source, target).transfer([blob])
+    assert target.missing([blob]) == [blob]
+
+    source.fail_after = None
+    assert BlobTransfer(source, target).transfer([blob]) == 1
+    assert source.offsets == [0, 512]
+    assert stored(target, blob) == content
+    assert os.listdir(target.partial_root) == []
+
+
+def test_content_mismatch(tmp_path):
+    source = LocalBlobStore(tmp_path / "source")
+    target = LocalBlobStore(tmp_path / "target")
+    blob = store_content(source, b"content")
+    wrong = make_blob(b"other")
+    os.makedirs(source.path(wrong).parent, exist_ok=True)
+    os.rename(source.path(blob), source.path(wrong))
+    with pytest.raises(QDValueError):
+        BlobTransfer(source, target).transfer([wrong])
+    assert target.missing([wrong]) == [wrong]
+    assert os.listdir(target.partial_root) == []
+
+
+def test_volume_source(tmp_path, contents):
+    volume = tmp_path / "volume"
+    volume.mkdir()
+    files = {}
+    for i, content in enumerate(contents):
+        (volume / str(i)).write_bytes(content)
+        files[make_blob(content)] = [File(volume="vol", path=str(i).encode())]
+    unknown = make_blob(b"unknown")
+    files[unknown] = [File(volume="other", path=b"0")]
+    helper = StorageHelper(None, {"volumes": {"vol": {"path": str(volume)}}})
+    source = VolumeBlobSource(helper, Collection(files=files), chunk_size=256)
+    target = LocalBlobStore(tmp_path / "target")
+    blobs = list(files)
+    assert source.missing(blobs) == [unknown]
+    assert BlobTransfer(source, target).transfer(blobs[:-1]) == 4
+    assert [stored(target, b) for b in blobs[:-1]] == contents
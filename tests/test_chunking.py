@@ -0,0 +1,98 @@
+from benchmarks.server import FakeServer
+from queryduck.connection import Connection
+from queryduck.query import Main, QDQuery
+from queryduck.repository import StatementRepository
+from queryduck.types import Statement
+
+import pytest
+
+
+def make_repo(server, graph):
+    repo = StatementRepository(Connection(server.url, "user", "password"))
+    return repo, repo.bindings_from_content(graph.bindings)
+
+
+def summary(results, coll):
+    return (
+        [r.handle for r in results],
+        sorted(str(h) for h in coll.statements),
+    )
+
+
+def compare(server, graph, build):
+    repo, b = make_repo(server, graph)
+    query = build(repo, b)
+    chunked = summary(*repo.execute(query))
+
+    repo, b = make_repo(server, graph)
+    query = build(repo, b)
+    unchunked = summary(*repo.execute(query, post_query=True))
+    return chunked, unchunked
+
+
+def test_chunked_inlist_matches_unchunked(server, graph):
+    def build(repo, b):
+        m = Main(Statement)
+        resources = [repo.unique_deserialize(r) for r in graph.resources[:1400]]
+        return QDQuery(Statement).add(
+            m.in_list(resources),
+            m.object_for(b.label).fetch(),
+            m.object_for(b.link0, b.link1).object_for(b.label).fetch(),
+        )
+
+    requests = server.requests
+    chunked, unchunked = compare(server, graph, build)
+    # Three chunks, the statements of the results within the limit, and the
+    # unchunked query.
+    assert server.requests - requests == 5
+    assert len(chunked[0]) == 1000
+    assert chunked == unchunked
+
+
+def test_chunked_inlist_below_limit(server, graph):
+    def build(repo, b):
+        m = Main(Statement)
+        resources = [repo.unique_deserialize(r) for r in graph.resources[:700]]
+        return QDQuery(Statement).add(
+            m.in_list(resources),
+            m.subject_for(b.link0).fetch(),
+        )
+
+    chunked, unchunked = compare(server, graph, build)
+    assert len(chunked[0]) == 700
+    assert chunked == unchunked
+
+
+def test_having_is_not_chunked(server, graph):
+    def build(repo, b):
+        m = Main(Statement)
+        resources = [repo.unique_deserialize(r) for r in graph.resources[:1400]]
+        return QDQuery(Statement).add(
+            m.in_list(resources),
+            m.object_for(b.number).having() > 500,
+        )
+
+    requests = server.requests
+    chunked, unchunked = compare(server, graph, build)
+    assert server.requests - requests == 2
+    assert chunked == unchunked
+
+
+class ReversedServer(FakeServer):
+    """Returns the results of every query in reverse order."""
+
+    def query(self, params, target):
+        response = super().query(params, target)
+        response["references"].reverse()
+        return response
+
+
+def test_chunked_results_sorted_on_client(graph):
+    with ReversedServer(graph.statements) as server:
+        repo, b = make_repo(server, graph)
+        m = Main(Statement)
+        resources = [repo.unique_deserialize(r) for r in graph.resources[:1400]]
+        results, coll = repo.execute(QDQuery(Statement).add(m.in_list(resources)))
+    handles = [r.handle for r in results]
+    assert len(handles) == 1000
+    assert handles == sorted(r.handle for r in resources)[:1000]
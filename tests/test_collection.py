@@ -0,0 +1,81 @@
+import uuid
+
+from queryduck.collection import BoundedGroupedCollection, Collection
+from queryduck.context import Context
+from queryduck.types import Blob, File, Statement
+
+
+def make_statements(n):
+    statements = {}
+    for i in range(n):
+        st = Statement(handle=uuid.uuid4())
+        st.triple = (st, st, i)
+        statements[st.handle] = st
+    return statements
+
+
+def test_same_collection_counted_once():
+    coll = Collection(statements=make_statements(10))
+    grouped = BoundedGroupedCollection(max_statements=15)
+    grouped.add_collection(coll)
+    grouped.add_collection(coll)
+    assert grouped.num_statements == 10
+    assert grouped.collections == [coll]
+    assert len(list(grouped.find())) == 10
+
+
+def test_shared_statements_counted_once():
+    statements = make_statements(10)
+    first = Collection(statements=statements)
+    second = Collection(statements=dict(statements))
+    grouped = BoundedGroupedCollection([first, second], max_statements=15)
+    assert grouped.num_statements == 10
+    assert grouped.collections == [first, second]
+
+    grouped.remove_collection(first)
+    assert grouped.num_statements == 10
+    grouped.remove_collection(second)
+    assert grouped.num_statements == 0
+
+
+def test_eviction():
+    first = Collection(statements=make_statements(10))
+    second = Collection(statements=make_statements(10))
+    grouped = BoundedGroupedCollection([first, second], max_statements=15)
+    assert grouped.collections == [second]
+    assert grouped.num_statements == 10
+
+
+def make_files(n):
+    blob = Blob(handle=uuid.uuid4().bytes * 2)
+    return {blob: [File(volume="vol", path=str(i).encode()) for i in range(n)]}
+
+
+def test_file_only_eviction():
+    grouped = BoundedGroupedCollection(max_statements=100)
+    members = [Collection(files=make_files(10)) for i in range(100)]
+    for coll in members:
+        grouped.add_collection(coll)
+    assert grouped.collections == members[-10:]
+    assert grouped.num_files == 100
+
+
+def test_find_marks_used():
+    first = Collection(statements=make_statements(10))
+    second = Collection(statements=make_statements(10))
+    grouped = BoundedGroupedCollection([first, second], max_statements=25)
+    assert len(list(grouped.find(o=3))) == 2
+    list(grouped.find(s=next(iter(first.statements.values()))))
+    grouped.add_collection(Collection(statements=make_statements(10)))
+    assert first in grouped.collections
+    assert second not in grouped.collections
+
+
+def test_transaction_pins_collection():
+    first = Collection(statements=make_statements(10))
+    second = Collection(statements=make_statements(10))
+    context = Context(None, None, max_statements=15)
+    context.coll.add_collection(first)
+    context.add(next(iter(first.statements.values())), None, 1)
+    context.coll.add_collection(second)
+    assert context.coll.collections == [first]
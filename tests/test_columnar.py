@@ -0,0 +1,75 @@
+import uuid
+
+from queryduck.columnar import ColumnarExport
+from queryduck.connection import Connection
+from queryduck.query import Main, QDQuery
+from queryduck.repository import StatementRepository
+from queryduck.types import Blob, Statement
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pa = pytest.importorskip("pyarrow")
+
+
+def test_query_to_numpy(small_server, small_graph):
+    repo = StatementRepository(Connection(small_server.url, "user", "password"))
+    m = Main(Statement)
+    export = ColumnarExport()
+    export.add_query(repo, QDQuery(Statement).add(m.fetch()))
+
+    rows = small_graph.statements
+    numbers = [int(o[4:]) for h, s, p, o in rows if o.startswith("int:")]
+    assert len(export) == len(rows)
+    arrays = export.to_numpy()
+    column = arrays["object_int"]
+    assert column.dtype == np.int64
+    assert isinstance(column, np.ma.MaskedArray)
+    assert sorted(column.compressed().tolist()) == sorted(numbers)
+    assert column.mask.sum() == len(export) - len(numbers)
+    assert not isinstance(arrays["handle"], np.ma.MaskedArray)
+
+    assert arrays["handle"].dtype == np.int32
+    ids = [uuid.UUID(bytes=v.tobytes()) for v in arrays["ids"]]
+    by_handle = {uuid.UUID(row[0][2:]): row for row in rows}
+    assert sorted(ids[i] for i in arrays["handle"]) == sorted(by_handle)
+    objects = arrays["object_s"]
+    for idx, code in enumerate(arrays["handle"]):
+        o = by_handle[ids[code]][3]
+        if o.startswith("s:"):
+            assert ids[objects[idx]] == uuid.UUID(o[2:])
+        else:
+            assert objects.mask[idx]
+
+
+def test_statements_match_serialized(small_server):
+    repo = StatementRepository(Connection(small_server.url, "user", "password"))
+    m = Main(Statement)
+    query = QDQuery(Statement).add(m.fetch())
+    serialized = ColumnarExport()
+    serialized.add_query(repo, query)
+    results, coll = repo.execute(query, post_query=True)
+    statements = ColumnarExport()
+    for handle in serialized.columns()["handle"]:
+        statements.add_statement(coll.get(uuid.UUID(handle)))
+
+    assert statements.columns() == serialized.columns()
+    table = statements.to_arrow()
+    assert table.column("subject").type.value_type == pa.binary(16)
+    assert table.to_pylist() == serialized.to_arrow().to_pylist()
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.targets = []
+
+    def post_query(self, params, target="statement", raw=False, stream=False):
+        self.targets.append(target)
+        return iter(['{"references": [], "statements": {}}'])
+
+
+def test_add_query_target():
+    repo = StatementRepository(RecordingConnection())
+    ColumnarExport().add_query(repo, QDQuery(Blob))
+    ColumnarExport().add_query(repo, QDQuery(Statement))
+    assert repo.connection.targets == ["blob", "statement"]
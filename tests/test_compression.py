@@ -0,0 +1,72 @@
+from queryduck.connection import APIWrapper
+
+import pytest
+
+
+class FakeResponse:
+    def __init__(self, status, text=""):
+        self.status_code = status
+        self.text = text
+        self.content = b"{}"
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        from requests.exceptions import HTTPError
+
+        if self.status_code >= 400:
+            raise HTTPError(response=self)
+
+    def json(self):
+        return {}
+
+
+class FakeAPI(APIWrapper):
+    def __init__(self, statuses, **kwargs):
+        super().__init__("http://localhost", "user", "password", **kwargs)
+        self.statuses = list(statuses)
+        self.encodings = []
+
+    def _send(self, method, path, read, **kwargs):
+        self.encodings.append(kwargs["headers"].get("Content-Encoding"))
+        if kwargs["data"] is not None and not isinstance(kwargs["data"], bytes):
+            list(kwargs["data"])
+        status = self.statuses.pop(0)
+        return FakeResponse(*status) if type(status) == tuple else FakeResponse(status)
+
+
+large = {"values": ["x" * 100] * 1000}
+
+
+def test_uncompressed_by_default():
+    api = FakeAPI([200])
+    api.post("path", large)
+    assert api.encodings == [None]
+
+
+@pytest.mark.parametrize(
+    "status", [415, (400, "Unsupported Content-Encoding: gzip")]
+)
+def test_falls_back_when_encoding_rejected(status):
+    api = FakeAPI([status, 200, 200], compression="gzip")
+    api.post("path", large)
+    api.post("path", large)
+    assert api.encodings == ["gzip", None, None]
+
+
+@pytest.mark.parametrize("status", [400, 403, 422])
+def test_other_errors_keep_compression(status):
+    from requests.exceptions import HTTPError
+
+    api = FakeAPI([status], compression="gzip")
+    with pytest.raises(HTTPError):
+        api.post("path", large)
+    assert api.encodings == ["gzip"]
+    assert api.compression == "gzip"
+
+
+def test_small_body_uncompressed():
+    api = FakeAPI([200], compression="gzip")
+    api.post("path", {"values": ["x"]})
+    assert api.encodings == [None]
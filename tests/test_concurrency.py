@@ -0,0 +1,130 @@
+import threading
+import time
+import uuid
+
+from benchmarks.server import FakeServer
+from queryduck.concurrency import SingleFlight
+from queryduck.connection import Connection
+from queryduck.query import Main, QDQuery
+from queryduck.repository import StatementRepository
+from queryduck.types import Statement
+
+import pytest
+
+
+def test_unique_deserialize_identity_under_contention():
+    repo = StatementRepository(None, thread_safe=True)
+    refs = ["s:{}".format(uuid.uuid4()) for i in range(2000)]
+    refs += ["blob:LXEWQrcmsEQBYnyp-6wy9chTD7GQPMTbAiWHF5IaSIE="] * 10
+    num_threads = 32
+    barrier = threading.Barrier(num_threads)
+    seen = [None] * num_threads
+
+    def work(idx):
+        barrier.wait()
+        # Every thread goes through the refs in a different order.
+        order = refs[idx:] + refs[:idx]
+        seen[idx] = {ref: repo.unique_deserialize(ref) for ref in order}
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(num_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for ref in refs:
+        instances = {id(values[ref]) for values in seen}
+        assert len(instances) == 1, ref
+    assert len(repo.statement_map) == 2000
+    assert len(repo.blob_map) == 1
+
+
+def test_unique_deserialize_without_locking():
+    repo = StatementRepository(None)
+    ref = "s:{}".format(uuid.uuid4())
+    st = repo.unique_deserialize(ref)
+    assert type(st) == Statement
+    assert repo.unique_deserialize(ref) is st
+    assert "_unique" not in vars(repo)
+
+
+def test_coalescing_follows_thread_safe():
+    assert not StatementRepository(None).coalesce_queries
+    assert StatementRepository(None, thread_safe=True).coalesce_queries
+    with pytest.raises(ValueError):
+        StatementRepository(None, coalesce_queries=True)
+
+
+class SlowServer(FakeServer):
+    def query(self, params, target):
+        time.sleep(0.3)
+        return super().query(params, target)
+
+
+def test_coalesced_queries(small_graph):
+    with SlowServer(small_graph.statements) as server:
+        repo = StatementRepository(
+            Connection(server.url, "user", "password"), thread_safe=True
+        )
+        b = repo.bindings_from_content(small_graph.bindings)
+        num_threads = 8
+        barrier = threading.Barrier(num_threads)
+        outcomes = [None] * num_threads
+
+        def work(idx):
+            m = Main(Statement)
+            query = QDQuery(Statement).add(
+                m.object_for(b.type) == repo.unique_deserialize(small_graph.types[0])
+            )
+            barrier.wait()
+            outcomes[idx] = repo.execute(query)
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(num_threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert server.requests == 1
+
+    results, coll = outcomes[0]
+    assert results
+    for other_results, other_coll in outcomes[1:]:
+        assert other_results == results
+        assert other_results is not results
+        assert other_coll is coll
+    # Callers can change their results without affecting each other.
+    results.clear()
+    assert outcomes[1][0]
+
+
+def test_singleflight_shares_errors():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def leader():
+        started.set()
+        release.wait()
+        raise ValueError("failed")
+
+    def call(func):
+        try:
+            flight.do("key", func)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call, args=(leader,))]
+    threads[0].start()
+    started.wait()
+    threads += [threading.Thread(target=call, args=(print,)) for i in range(3)]
+    for t in threads[1:]:
+        t.start()
+    # Let the waiters reach the call in flight.
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(errors) == 4
+    assert all(e is errors[0] for e in errors)
+    assert flight.calls == {}
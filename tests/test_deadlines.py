@@ -0,0 +1,99 @@
+import threading
+import time
+
+from queryduck.concurrency import SingleFlight
+from queryduck.connection import APIWrapper
+from queryduck.deadlines import deadline
+from queryduck.exceptions import DeadlineExceeded
+
+import pytest
+
+
+def test_singleflight_waiter_follows_deadline():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def leader():
+        started.set()
+        release.wait()
+        return "result"
+
+    thread = threading.Thread(target=flight.do, args=("key", leader))
+    thread.start()
+    started.wait()
+    try:
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            with deadline(0.1):
+                flight.do("key", lambda: "other")
+        assert time.monotonic() - start < 1
+    finally:
+        release.set()
+        thread.join()
+
+
+class FakeAPI(APIWrapper):
+    def __init__(self, responses):
+        super().__init__("http://localhost", "user", "password", hedge_quantile=0.5)
+        self.responses = list(responses)
+        self.threads = []
+        for i in range(self.hedge_min_samples):
+            self._observe_latency("path", 0.01)
+
+    def _request(self, method, path, params=None, raw=False, **kwargs):
+        self.threads.append(threading.current_thread())
+        delay, response = self.responses.pop(0)
+        time.sleep(delay)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def test_hedge_first_response_wins():
+    api = FakeAPI([(1, "primary"), (0, "hedge")])
+    start = time.monotonic()
+    assert api._hedged_request("GET", "path", None, False) == "hedge"
+    assert time.monotonic() - start < 0.5
+    api.close()
+
+
+def test_hedge_used_when_primary_fails():
+    api = FakeAPI([(0.3, ValueError()), (0, "hedge")])
+    assert api._hedged_request("GET", "path", None, False) == "hedge"
+    api.close()
+
+
+def test_primary_error_without_hedge():
+    api = FakeAPI([(0, ValueError())])
+    with pytest.raises(ValueError):
+        api._hedged_request("GET", "path", None, False)
+    api.close()
+
+
+def test_hedge_follows_deadline():
+    api = FakeAPI([(1, "primary"), (1, "hedge")])
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        with deadline(0.2):
+            api._hedged_request("GET", "path", None, False)
+    assert time.monotonic() - start < 0.5
+    api.close()
+
+
+def test_hedge_delay_follows_recent_latencies():
+    api = FakeAPI([])
+    assert api._hedge_delay("path") == 0.01
+    for i in range(api.latency_window):
+        api._observe_latency("path", 2.0)
+    assert api._hedge_delay("path") == 2.0
+
+
+def test_close():
+    api = FakeAPI([(0.3, "primary"), (0, "hedge")])
+    api._hedged_request("GET", "path", None, False)
+    executor = api._hedge_executor
+    api.close()
+    assert api._hedge_executor is None
+    with pytest.raises(RuntimeError):
+        executor.submit(print)
@@ -0,0 +1,56 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from queryduck.connection import Connection
+from queryduck.query import Main, QDQuery
+from queryduck.repository import StatementRepository
+from queryduck.serialization import serialize
+from queryduck.types import Statement
+
+import pytest
+
+
+def make_repo(server, **kwargs):
+    return StatementRepository(Connection(server.url, "user", "password"), **kwargs)
+
+
+def execute(repo, graph):
+    """Run a query with joins and fetches, and describe its outcome."""
+    b = repo.bindings_from_content(graph.bindings)
+    m = Main(Statement)
+    query = QDQuery(Statement).add(
+        m.object_for(b.type) == repo.unique_deserialize(graph.types[0]),
+        m.fetch(),
+        m.object_for(b.link0, b.link1).object_for(b.label).fetch(),
+    )
+    results, coll = repo.execute(query, post_query=True)
+    statements = sorted(
+        [serialize(st)] + [serialize(v) for v in st.triple]
+        for st in coll.statements.values()
+    )
+    return [r.handle for r in results], statements
+
+
+@pytest.fixture(scope="module")
+def expected(small_server, small_graph):
+    expected = execute(make_repo(small_server), small_graph)
+    assert expected[0] and expected[1]
+    return expected
+
+
+def test_lazy(small_server, small_graph, expected):
+    assert execute(make_repo(small_server, lazy=True), small_graph) == expected
+
+
+def test_pooled(small_server, small_graph, expected):
+    with ProcessPoolExecutor(2) as pool:
+        repo = make_repo(small_server, decode_pool=pool)
+        repo.decode_pool_threshold = 0
+        assert execute(repo, small_graph) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [64 * 1024, 7])
+def test_streamed(small_server, small_graph, expected, chunk_size):
+    repo = make_repo(small_server, stream_responses=True)
+    # Small chunks split tokens and values between chunks.
+    repo.connection.chunk_size = chunk_size
+    assert execute(repo, small_graph) == expected
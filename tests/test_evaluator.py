@@ -0,0 +1,241 @@
+"""Query semantics, checked against hand-written expectations.
+
+The queries run against a small fixed graph, both locally with
+QueryEvaluator and through a StatementRepository posting them to
+FakeServer, which checks that they survive serialization as well. The
+expected results follow from the semantics of the server's SQL
+implementation, as documented on QueryEvaluator.
+"""
+import uuid
+
+from benchmarks.server import FakeServer
+from queryduck.collection import Collection
+from queryduck.connection import Connection
+from queryduck.evaluator import QueryEvaluator
+from queryduck.query import AfterTuple, IsNull, Main, QDQuery
+from queryduck.repository import StatementRepository
+from queryduck.types import Statement
+
+import pytest
+
+
+def handle(n):
+    return "s:{}".format(uuid.UUID(int=n))
+
+
+# Resources, in the order of their handles, and the predicates and types
+RESOURCES = ["alice", "bob", "carol", "rex", "dave"]
+TERMS = ["type", "name", "age", "knows", "since", "Person", "Dog"]
+H = {name: handle(i + 1) for i, name in enumerate(RESOURCES)}
+H.update({name: handle(1000 + i) for i, name in enumerate(TERMS)})
+
+
+def graph_rows():
+    rows = []
+
+    def add(s, p, o):
+        rows.append([handle(100 + len(rows)), H[s], H[p], o])
+        return rows[-1][0]
+
+    for name, kind, age in [
+        ("alice", "Person", 30),
+        ("bob", "Person", 25),
+        ("carol", "Person", 35),
+        ("rex", "Dog", 3),
+        ("dave", "Person", None),
+    ]:
+        add(name, "type", H[kind])
+        add(name, "name", "str:{}".format(name))
+        if age is not None:
+            add(name, "age", "int:{}".format(age))
+    knows = add("alice", "knows", H["bob"])
+    add("alice", "knows", H["carol"])
+    add("bob", "knows", H["carol"])
+    rows.append([handle(100 + len(rows)), knows, H["since"], "int:2010"])
+    return rows
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return graph_rows()
+
+
+@pytest.fixture(scope="module")
+def server(rows):
+    with FakeServer(rows) as server:
+        yield server
+
+
+@pytest.fixture(params=["local", "server"])
+def run(request, rows):
+    """Return a function that builds a query and executes it."""
+    if request.param == "local":
+        repo = StatementRepository(None)
+        statements = {}
+        for ser_handle, *ser_triple in rows:
+            st = repo.unique_deserialize(ser_handle)
+            st.triple = tuple(repo.unique_deserialize(v) for v in ser_triple)
+            statements[st.handle] = st
+        coll = Collection(statements=statements)
+        execute = QueryEvaluator(coll).execute
+    else:
+        server = request.getfixturevalue("server")
+        repo = StatementRepository(Connection(server.url, "user", "password"))
+
+        def execute(query):
+            return repo.execute(query, post_query=True)
+
+    values = {name: repo.unique_deserialize(h) for name, h in H.items()}
+    names = {v.handle: name for name, v in values.items()}
+
+    def run(build):
+        results, coll = execute(build(values))
+        return [names[r.handle] for r in results], coll
+
+    return run
+
+
+def people(v):
+    m = Main(Statement)
+    return m, QDQuery(Statement).add(m.object_for(v["type"]) == v["Person"])
+
+
+def test_equals(run):
+    results, coll = run(lambda v: people(v)[1])
+    assert results == ["alice", "bob", "carol", "dave"]
+
+
+def test_inlist(run):
+    def build(v):
+        m, q = people(v)
+        return q.add(m.in_list([v["carol"], v["alice"], v["rex"]]))
+
+    assert run(build)[0] == ["alice", "carol"]
+
+
+def test_comparison(run):
+    def build(v):
+        m, q = people(v)
+        return q.add(m.object_for(v["age"]) > 28)
+
+    assert run(build)[0] == ["alice", "carol"]
+
+
+def test_is_null(run):
+    def build(v):
+        m, q = people(v)
+        return q.add(IsNull(m.object_for(v["age"])))
+
+    assert run(build)[0] == ["dave"]
+
+
+def test_subject_for(run):
+    def build(v):
+        m = Main(Statement)
+        return QDQuery(Statement).add(m.subject_for(v["knows"]) == v["alice"])
+
+    assert run(build)[0] == ["bob", "carol"]
+
+
+def test_chained_joins(run):
+    def build(v):
+        m, q = people(v)
+        return q.add(m.object_for(v["knows"]).object_for(v["name"]) == "carol")
+
+    assert run(build)[0] == ["alice", "bob"]
+
+
+def test_meta_join(run):
+    def build(v):
+        m, q = people(v)
+        return q.add(m.object_for(v["knows"]).object_meta(v["since"]) == 2010)
+
+    assert run(build)[0] == ["alice"]
+
+
+@pytest.mark.parametrize(
+    "count, expected", [(1, ["alice", "bob"]), (2, ["alice"]), (3, [])]
+)
+def test_having(run, count, expected):
+    def build(v):
+        m, q = people(v)
+        return q.add(m.object_for(v["knows"]).having() >= count)
+
+    assert run(build)[0] == expected
+
+
+def test_order_ascending(run):
+    def build(v):
+        m, q = people(v)
+        return q.add(m.object_for(v["age"]).order_asc("int"))
+
+    assert run(build)[0] == ["bob", "alice", "carol", "dave"]
+
+
+def test_order_descending(run):
+    def build(v):
+        m, q = people(v)
+        return q.add(m.object_for(v["age"]).order_desc("int"))
+
+    assert run(build)[0] == ["dave", "carol", "alice", "bob"]
+
+
+def test_order_by_string(run):
+    def build(v):
+        m = Main(Statement)
+        return QDQuery(Statement).add(
+            m.object_for(v["type"]).in_list([v["Person"], v["Dog"]]),
+            m.object_for(v["name"]).order_desc("str"),
+        )
+
+    assert run(build)[0] == ["rex", "dave", "carol", "bob", "alice"]
+
+
+def test_after(run):
+    def build(v):
+        m, q = people(v)
+        return q.add(
+            m.object_for(v["age"]).order_asc("int"),
+            AfterTuple([30, v["alice"]]),
+        )
+
+    assert run(build)[0] == ["carol", "dave"]
+
+
+def test_limit(run):
+    def build(v):
+        m, q = people(v)
+        q.add(m.object_for(v["age"]).order_asc("int"))
+        q.limit = 2
+        return q
+
+    results, coll = run(build)
+    # The limit isn't sent to the server, which applies its own default.
+    assert results[:2] == ["bob", "alice"]
+
+
+def test_fetch(run):
+    def build(v):
+        m, q = people(v)
+        return q.add(m.in_list([v["bob"]]), m.object_for(v["knows"]).fetch())
+
+    results, coll = run(build)
+    assert results == ["bob"]
+    triples = {
+        tuple(str(x.handle) for x in st.triple) for st in coll.statements.values()
+    }
+    # bob himself has no triple, so only the joined statement is returned.
+    assert triples == {(H["bob"][2:], H["knows"][2:], H["carol"][2:])}
+
+
+def test_fetch_main(run):
+    def build(v):
+        m, q = people(v)
+        return q.add(m.in_list([v["carol"]]), m.fetch())
+
+    results, coll = run(build)
+    objects = {
+        getattr(st.triple[2], "handle", st.triple[2])
+        for st in coll.statements.values()
+    }
+    assert objects == {35, "carol", uuid.UUID(H["Person"][2:])}
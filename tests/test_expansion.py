@@ -0,0 +1,62 @@
+from queryduck.connection import Connection
+from queryduck.expansion import NeighborhoodExpander
+from queryduck.repository import StatementRepository
+from queryduck.utility import DocProcessor
+
+import pytest
+
+
+def neighborhood(graph, start, depth):
+    """Compute the handles of the statements within depth hops of start."""
+    rows = {row[0]: row for row in graph.statements}
+    found = set()
+    frontier = {start}
+    visited = {start}
+    for level in range(depth):
+        hop = {
+            row[0]
+            for row in graph.statements
+            if row[0] in frontier or row[1] in frontier or row[3] in frontier
+        }
+        found |= hop
+        frontier = set()
+        for handle in hop:
+            for v in (rows[handle][1], rows[handle][3]):
+                if v.startswith("s:") and v not in visited:
+                    visited.add(v)
+                    frontier.add(v)
+    return {h[2:] for h in found}
+
+
+@pytest.mark.parametrize("batch_size", [1000, 7])
+def test_expand(small_server, small_graph, batch_size):
+    start = small_graph.resources[0]
+    repo = StatementRepository(Connection(small_server.url, "user", "password"))
+    expander = NeighborhoodExpander(repo)
+    expander.batch_size = batch_size
+    coll = expander.expand([repo.unique_deserialize(start)], 3)
+    assert {str(h) for h in coll.statements} == neighborhood(small_graph, start, 3)
+
+
+def normalize(doc):
+    """Sort lists in a document, as the order of statements isn't defined."""
+    if isinstance(doc, dict):
+        return {k: normalize(v) for k, v in doc.items()}
+    if isinstance(doc, list):
+        return sorted((normalize(v) for v in doc), key=repr)
+    return doc
+
+
+def test_doc_with_expansion(small_server, small_graph):
+    repo = StatementRepository(Connection(small_server.url, "user", "password"))
+    bindings = repo.bindings_from_content(small_graph.bindings)
+    value = repo.unique_deserialize(small_graph.resources[0])
+    expander = NeighborhoodExpander(repo)
+    # The collection already holds part of the neighborhood.
+    known = expander.expand([value], 1, bindings.reverse_exists)
+    prefetched = expander.expand([value], 2, bindings.reverse_exists)
+    expanded_doc = DocProcessor(known, bindings, expander).value_to_doc(
+        value, expand_depth=2
+    )
+    doc = DocProcessor(prefetched, bindings).value_to_doc(value)
+    assert normalize(expanded_doc) == normalize(doc)
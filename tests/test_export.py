@@ -0,0 +1,87 @@
+import gzip
+import json
+import threading
+import time
+import uuid
+
+from benchmarks.server import FakeServer
+from queryduck.connection import Connection
+from queryduck.export import StatementExporter, StatementImporter
+from queryduck.repository import StatementRepository
+
+import pytest
+
+
+class RecordingRepo:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.committed = set()
+        self.missing = []
+
+    def import_statements(self, chunk):
+        with self.lock:
+            for row in chunk:
+                for v in row[1:]:
+                    if v.startswith("s:") and v not in self.committed:
+                        if v not in {r[0] for r in chunk}:
+                            self.missing.append(v)
+        # Earlier chunks take longer, so later ones would overtake them.
+        time.sleep(0.05 if int(chunk[0][3][4:]) % 8 == 0 else 0)
+        with self.lock:
+            self.committed.update(row[0] for row in chunk)
+
+
+def test_import_waits_for_referenced_chunks(tmp_path):
+    predicate = "s:{}".format(uuid.uuid4())
+    rows = []
+    for i in range(64):
+        handle = "s:{}".format(uuid.uuid4())
+        # Every eighth statement refers to the one before it.
+        if i % 8 == 1:
+            rows.append([handle, rows[-1][0], predicate, "int:{}".format(i)])
+        else:
+            rows.append([handle, predicate, predicate, "int:{}".format(i)])
+    path = tmp_path / "statements.ndjson"
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+
+    repo = RecordingRepo()
+    repo.committed.add(predicate)
+    importer = StatementImporter(repo, path, chunk_size=1, parallelism=4)
+    assert importer.run() == 64
+    assert repo.missing == []
+    assert len(repo.committed) == 65
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedExporter(StatementExporter):
+    """Exporter that is interrupted halfway through writing a page."""
+
+    def __init__(self, repo, path, interrupt_at):
+        super().__init__(repo, path)
+        self.interrupt_at = interrupt_at
+        self.pages = 0
+
+    def _write_page(self, f, statements):
+        self.pages += 1
+        if self.pages == self.interrupt_at:
+            f.write(b'["s:partial"')
+            raise Interrupted()
+        super()._write_page(f, statements)
+
+
+@pytest.mark.parametrize("name", ["statements.ndjson", "statements.ndjson.gz"])
+def test_export_resume(tmp_path, small_graph, name):
+    path = tmp_path / name
+    rows = small_graph.statements
+    with FakeServer(rows, page_size=64) as server:
+        repo = StatementRepository(Connection(server.url, "user", "password"))
+        with pytest.raises(Interrupted):
+            InterruptedExporter(repo, path, interrupt_at=3).export()
+        assert StatementExporter(repo, path).export() == len(rows)
+
+    opener = gzip.open if name.endswith(".gz") else open
+    with opener(path, "rt") as f:
+        assert [json.loads(line) for line in f] == rows
@@ -0,0 +1,77 @@
+import hashlib
+import itertools
+import uuid
+
+from queryduck.collection import Collection
+from queryduck.frozen import FrozenCollection
+from queryduck.repository import StatementRepository
+from queryduck.serialization import serialize
+from queryduck.types import Blob, File, Statement
+
+import pytest
+
+
+@pytest.fixture
+def collections(tmp_path, small_graph):
+    repo = StatementRepository(None)
+    statements = {}
+    for ser_handle, *ser_triple in small_graph.statements:
+        st = repo.unique_deserialize(ser_handle)
+        st.triple = tuple(repo.unique_deserialize(v) for v in ser_triple)
+        statements[st.handle] = st
+    files = {}
+    for i in range(20):
+        blob = Blob(handle=hashlib.sha256(str(i).encode()).digest())
+        files[blob] = [
+            File(volume="vol", path="{}/{}".format(i, j).encode())
+            for j in range(i % 3 + 1)
+        ]
+    coll = Collection(statements=statements, files=files)
+    coll.freeze(tmp_path / "frozen")
+    # A repository of its own, so statements are deserialized from the file.
+    frozen = FrozenCollection(StatementRepository(None), tmp_path / "frozen")
+    yield coll, frozen
+    frozen.close()
+
+
+def handles(statements):
+    return sorted(st.handle for st in statements)
+
+
+def test_find(collections):
+    coll, frozen = collections
+    assert len(frozen) == len(coll.statements)
+    triples = {st.triple for st in coll.statements.values()}
+    for triple in triples:
+        for mask in itertools.product((False, True), repeat=3):
+            spo = [v if given else None for v, given in zip(triple, mask)]
+            assert handles(frozen.find(*spo)) == handles(coll.find(*spo)), spo
+
+
+def test_find_missing(collections):
+    coll, frozen = collections
+    st = next(iter(coll.statements.values()))
+    unknown = Statement(handle=uuid.uuid4())
+    s = st.triple[0]
+    for spo in [(unknown, None, None), (s, None, "missing"), (None, None, -1)]:
+        assert frozen.find(*spo) == coll.find(*spo) == []
+
+
+def test_get(collections):
+    coll, frozen = collections
+    for handle, st in coll.statements.items():
+        frozen_st = frozen.get(handle)
+        assert frozen_st.handle == handle
+        assert [serialize(v) for v in frozen_st.triple] == [
+            serialize(v) for v in st.triple
+        ]
+    with pytest.raises(KeyError):
+        frozen.get(uuid.uuid4())
+
+
+def test_get_files(collections):
+    coll, frozen = collections
+    blobs = list(coll.files) + [Blob(handle=hashlib.sha256(b"none").digest())]
+    for blob in blobs:
+        expected = [serialize(f) for f in coll.get_files(blob)]
+        assert sorted(serialize(f) for f in frozen.get_files(blob)) == sorted(expected)
@@ -0,0 +1,31 @@
+from queryduck.instrumentation import Recorder
+
+
+def test_prometheus_text():
+    recorder = Recorder(buckets=(0.1, 1.0))
+    recorder.count("requests_total", method="GET", status=200)
+    recorder.count("requests_total", 2, method="GET", status=200)
+    recorder.count("requests_total", method="POST", status=500)
+    recorder.observe("request_seconds", 0.05, method="GET")
+    recorder.observe("request_seconds", 0.5, method="GET")
+    recorder.observe("request_seconds", 5.0, method="GET")
+    assert recorder.prometheus_text() == (
+        "# TYPE requests_total counter\n"
+        'requests_total{method="GET",status="200"} 3\n'
+        'requests_total{method="POST",status="500"} 1\n'
+        "# TYPE request_seconds histogram\n"
+        'request_seconds_bucket{method="GET",le="0.1"} 1\n'
+        'request_seconds_bucket{method="GET",le="1.0"} 2\n'
+        'request_seconds_bucket{method="GET",le="+Inf"} 3\n'
+        'request_seconds_sum{method="GET"} 5.55\n'
+        'request_seconds_count{method="GET"} 3\n'
+    )
+
+
+def test_label_escaping():
+    recorder = Recorder()
+    recorder.count("files_total", path='a "b"\\c\nd')
+    assert recorder.prometheus_text() == (
+        "# TYPE files_total counter\n"
+        'files_total{path="a \\"b\\"\\\\c\\nd"} 1\n'
+    )
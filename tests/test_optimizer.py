@@ -0,0 +1,114 @@
+from queryduck.collection import Collection
+from queryduck.connection import Connection
+from queryduck.evaluator import QueryEvaluator
+from queryduck.optimizer import optimize_query
+from queryduck.query import Main, QDQuery
+from queryduck.repository import StatementRepository
+from queryduck.types import Statement
+
+import pytest
+
+
+def duplicate_elements(v, b):
+    m = Main(Statement)
+    return QDQuery(Statement).add(
+        m.object_for(b.type) == v.types[0],
+        m.object_for(b.type) == v.types[0],
+        m.object_for(b.number) < 500,
+        m.object_for(b.number) < 500,
+    )
+
+
+def overlapping_lists(v, b):
+    m = Main(Statement)
+    return QDQuery(Statement).add(
+        m.in_list(v.resources[:40] + v.resources[:10]),
+        m.in_list(v.resources[20:60]),
+        m.object_for(b.label).fetch(),
+    )
+
+
+def list_implied_by_equals(v, b):
+    t = Main(Statement).object_for(b.type)
+    return QDQuery(Statement).add(t.in_list(v.types[:2]), t == v.types[1])
+
+
+def single_value_list(v, b):
+    m = Main(Statement)
+    t = m.object_for(b.type)
+    return QDQuery(Statement).add(
+        t.in_list([v.types[2], v.types[2]]),
+        t.in_list(v.types[1:3]),
+        m.object_for(b.number).order_asc("int"),
+    )
+
+
+def equivalent_joins(v, b):
+    m = Main(Statement)
+    return QDQuery(Statement).add(
+        m.object_for(b.link0, b.link1).object_for(b.type) == v.types[0],
+        m.object_for(b.link0, b.link1).object_for(b.type) == v.types[0],
+        m.object_for(b.link0, b.link1).object_for(b.label).fetch(),
+    )
+
+
+def unused_join(v, b):
+    m = Main(Statement)
+    return QDQuery(Statement).add(
+        m.object_for(b.type) == v.types[3],
+        m.object_for(b.link2).object_for(b.number),
+    )
+
+
+QUERIES = [
+    duplicate_elements,
+    overlapping_lists,
+    list_implied_by_equals,
+    single_value_list,
+    equivalent_joins,
+    unused_join,
+]
+
+
+class Values:
+    def __init__(self, repo, graph):
+        self.types = [repo.unique_deserialize(t) for t in graph.types]
+        self.resources = [repo.unique_deserialize(r) for r in graph.resources]
+
+
+def summary(results, coll):
+    return [r.handle for r in results], sorted(coll.statements)
+
+
+@pytest.mark.parametrize("build", QUERIES)
+def test_local(small_graph, build):
+    repo = StatementRepository(None)
+    statements = {}
+    for ser_handle, *ser_triple in small_graph.statements:
+        st = repo.unique_deserialize(ser_handle)
+        st.triple = tuple(repo.unique_deserialize(v) for v in ser_triple)
+        statements[st.handle] = st
+    evaluator = QueryEvaluator(Collection(statements=statements))
+    v = Values(repo, small_graph)
+    b = repo.bindings_from_content(small_graph.bindings)
+    query = build(v, b)
+    optimized = optimize_query(query)
+    assert len(optimized.elements) < len(query.elements)
+    expected = summary(*evaluator.execute(query))
+    assert expected[0]
+    assert summary(*evaluator.execute(optimized)) == expected
+
+
+@pytest.mark.parametrize("build", QUERIES)
+def test_server(small_server, small_graph, build):
+    results = []
+    for optimize in (False, True):
+        repo = StatementRepository(
+            Connection(small_server.url, "user", "password"),
+            optimize_queries=optimize,
+        )
+        v = Values(repo, small_graph)
+        b = repo.bindings_from_content(small_graph.bindings)
+        results.append(summary(*repo.execute(build(v, b), post_query=True)))
+    assert results[0][0]
+    assert results[1] == results[0]
@@ -0,0 +1,59 @@
+import threading
+
+from benchmarks.server import FakeServer
+from queryduck.connection import Connection
+from queryduck.replica import StatementReplica
+from queryduck.repository import StatementRepository
+
+
+def test_sync(tmp_path, small_graph):
+    rows = small_graph.statements
+    with FakeServer(rows[:200], page_size=64) as server:
+        repo = StatementRepository(Connection(server.url, "user", "password"))
+        replica = StatementReplica(repo, tmp_path / "replica.db")
+        assert replica.sync() == 200
+        server.create_statements(rows[200:])
+        assert replica.sync() == len(rows) - 200
+        assert replica.sync() == 0
+        replica.close()
+
+        # The cursor is kept across sessions.
+        replica = StatementReplica(repo, tmp_path / "replica.db")
+        assert replica.sync() == 0
+
+    b = repo.bindings_from_content(small_graph.bindings)
+    expected = sorted(h[2:] for h, s, p, o in rows if p[2:] == str(b.type.handle))
+    assert sorted(str(st.handle) for st in replica.find(p=b.type)) == expected
+    handle, s, p, o = rows[0]
+    st = replica.get(repo.unique_deserialize(handle).handle)
+    assert str(st.triple[0].handle) == s[2:]
+    replica.close()
+
+
+def test_concurrent_use(tmp_path, small_graph):
+    with FakeServer(small_graph.statements, page_size=10) as server:
+        repo = StatementRepository(Connection(server.url, "user", "password"))
+        b = repo.bindings_from_content(small_graph.bindings)
+        replica = StatementReplica(repo, tmp_path / "replica.db")
+        errors = []
+        done = threading.Event()
+
+        def read():
+            try:
+                while not done.is_set():
+                    for st in replica.find(p=b.type):
+                        replica.get(st.handle)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=read) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            assert replica.sync() == len(small_graph.statements)
+        finally:
+            done.set()
+            for thread in threads:
+                thread.join()
+        replica.close()
+    assert errors == []
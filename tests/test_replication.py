@@ -0,0 +1,75 @@
+import socket
+import time
+import uuid
+
+from benchmarks.server import FakeServer
+from queryduck.connection import ReplicatedConnection
+
+import pytest
+
+
+def dead_url():
+    """Return the URL of a port nothing listens on."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return "http://127.0.0.1:{}".format(s.getsockname()[1])
+
+
+def make_connection(url, replica_urls, **kwargs):
+    conn = ReplicatedConnection(
+        url, replica_urls, "user", "password", balancing="latency", **kwargs
+    )
+    # Endpoints without a latency yet are preferred over the primary.
+    conn.primary.latency = 1.0
+    return conn
+
+
+def test_failover_past_dead_endpoint():
+    with FakeServer() as primary:
+        conn = make_connection(primary.url, [dead_url()], eject_after=2)
+        replica = conn.endpoints[1]
+        for i in range(5):
+            assert conn.get_statements() == {"statements": []}
+        assert primary.requests == 5
+        assert replica.ejected_until > time.monotonic()
+
+
+def test_recovery_after_ejection():
+    with FakeServer() as primary, FakeServer() as server:
+        conn = make_connection(
+            primary.url, [dead_url()], eject_after=1, eject_seconds=0.2
+        )
+        replica = conn.endpoints[1]
+        conn.get_statements()
+        assert replica.ejected_until > time.monotonic()
+
+        # The replica comes back up.
+        replica.url = server.url
+        conn.get_statements()
+        assert server.requests == 0
+        time.sleep(0.3)
+        conn.get_statements()
+        assert server.requests == 1
+        assert replica.latency is not None
+
+
+def test_writes_go_to_primary():
+    row = ["s:{}".format(uuid.uuid4()) for i in range(3)] + ["int:1"]
+    with FakeServer() as primary, FakeServer() as replica:
+        conn = make_connection(primary.url, [replica.url])
+        conn.get_statements()
+        assert replica.requests == 1
+        conn.create_statements([row])
+        conn.submit_transaction([[None] + row[1:]])
+        assert primary.requests == 2
+        assert replica.requests == 1
+
+
+def test_writes_not_retried_on_replicas():
+    from requests.exceptions import ConnectionError
+
+    with FakeServer() as replica:
+        conn = make_connection(dead_url(), [replica.url])
+        with pytest.raises(ConnectionError):
+            conn.create_statements([])
+        assert replica.requests == 0
@@ -0,0 +1,131 @@
+import contextlib
+import io
+import os
+
+from pathlib import Path
+
+from benchmarks.server import FakeServer
+from benchmarks.synthetic import generate_file_tree
+from queryduck.connection import Connection
+from queryduck.exceptions import UserError
+from queryduck.storage import VolumeFileAnalyzer, VolumeProcessor, VolumeTrie
+
+import pytest
+
+
+@pytest.fixture
+def volume(tmp_path):
+    generate_file_tree(tmp_path, 50)
+    with FakeServer() as server:
+        yield server, Connection(server.url, "user", "password"), tmp_path
+
+
+def update(conn, root, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        VolumeProcessor(conn, "volume", root, **kwargs).update()
+
+
+def drop_inodes(server):
+    for record in server.volumes["volume"].values():
+        record.pop("device")
+        record.pop("inode")
+
+
+def test_moved_file_keeps_handle(volume):
+    server, conn, root = volume
+    update(conn, root)
+    records = server.volumes["volume"]
+    path = sorted(records)[0]
+    handle = records[path]["handle"]
+    os.rename(root / path, root / "moved.bin")
+    update(conn, root)
+    assert path not in records
+    assert records["moved.bin"]["handle"] == handle
+
+
+def test_no_backfill_for_servers_without_inodes(volume):
+    server, conn, root = volume
+    update(conn, root)
+    drop_inodes(server)
+    requests = server.requests
+    update(conn, root)
+    update(conn, root)
+    assert all("inode" not in r for r in server.volumes["volume"].values())
+    # Only the listing of the records, no updates.
+    assert server.requests - requests == 2
+
+
+def test_backfill_when_enabled(volume):
+    server, conn, root = volume
+    update(conn, root)
+    drop_inodes(server)
+    update(conn, root, backfill_inodes=True)
+    records = server.volumes["volume"]
+    for path, record in records.items():
+        assert record["inode"] == (Path(root) / path).stat().st_ino
+
+
+def test_volume_trie():
+    trie = VolumeTrie({"outer": Path("/data"), "inner": Path("/data/photos")})
+    assert trie.lookup(Path("/data/a.txt").parts) == ("outer", 2)
+    assert trie.lookup(Path("/data/photos/2020/a.jpg").parts) == ("inner", 3)
+    assert trie.lookup(Path("/data/photosx/a.jpg").parts) == ("outer", 2)
+    # Only paths strictly inside a volume match.
+    assert trie.lookup(Path("/data").parts) is None
+    assert trie.lookup(Path("/other/a.txt").parts) is None
+
+
+def test_analyze(tmp_path):
+    (tmp_path / "inner" / "sub").mkdir(parents=True)
+    analyzer = VolumeFileAnalyzer(
+        {
+            "outer": {"path": str(tmp_path)},
+            "inner": {"path": str(tmp_path / "inner")},
+        }
+    )
+    paths = [
+        tmp_path / "a.txt",
+        tmp_path / "inner" / "b.txt",
+        tmp_path / "inner" / "sub" / "c.txt",
+        tmp_path / "inner" / "sub" / "d.txt",
+    ]
+    files = analyzer.analyze_many(paths)
+    assert [(f.volume, f.path) for f in files] == [
+        ("outer", b"a.txt"),
+        ("inner", b"b.txt"),
+        ("inner", b"sub/c.txt"),
+        ("inner", b"sub/d.txt"),
+    ]
+    assert len(analyzer.directories) == 3
+    with pytest.raises(UserError):
+        analyzer.analyze(Path("/nonexistent/e.txt"))
+    with pytest.raises(UserError):
+        analyzer.analyze(tmp_path / "inner")
+
+
+def test_find_files_batches():
+    with FakeServer() as server:
+        conn = Connection(server.url, "user", "password")
+        paths = ["dir/file{}.bin".format(i) for i in range(600)]
+        server.mutate_files("volume", {p: {"size": 1} for p in paths[::2]})
+        requests = server.requests
+        found = conn.find_files("volume", paths)
+        assert server.requests - requests == 3
+        assert sorted(found) == sorted(paths[::2])
+
+        # Long paths are split by the length of the URL instead.
+        long_paths = ["{}/{}".format("x" * 1000, i) for i in range(20)]
+        requests = server.requests
+        assert conn.find_files("volume", long_paths) == {}
+        assert server.requests - requests == 5
+
+
+def test_find_local_files(volume):
+    server, conn, root = volume
+    update(conn, root)
+    analyzer = VolumeFileAnalyzer({"volume": {"path": str(root)}})
+    paths = sorted(p for p in Path(root).rglob("*") if p.is_file())
+    found = analyzer.find_files(conn, paths + [Path(root) / "missing.bin"])
+    assert sorted(found) == paths
+    for path, record in found.items():
+        assert record["path"] == str(path.relative_to(root))